@@ -53,3 +53,360 @@ Feature: Base behavior
       /bin/bash
 
       """
+
+  Scenario: Reuse a previous build of the same commit
+    Given the fixture repository
+    Given the config option build.reuse is set to true
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: laika deploy main
+    And on the target dir we run the command: sh -c "ls -d 2* | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      1
+
+      """
+
+  Scenario: Force a new build of the same commit
+    Given the fixture repository
+    Given the config option build.reuse is set to true
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: sleep 1
+    And on the source dir we run the command: laika -q deploy --rebuild main
+    And on the target dir we run the command: sh -c "ls -d 2* | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      2
+
+      """
+
+  Scenario: Reuse dependencies from a previous build
+    Given the fixture repository
+    Given the build command is set to test -d deps || { mkdir deps && echo $$ > deps/stamp; }
+    Given the config option dependency_cache:deps.key_files is set to hello.txt
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: sleep 1
+    And on the source dir we run the command: laika -q deploy main
+    And on the target dir we run the command: sh -c "cat 2*/deps/stamp | uniq | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      1
+
+      """
+
+  Scenario: List builds
+    Given the fixture repository
+    When on the source dir we run the command: laika -q build main
+    And on the source dir we run the command: laika reindex
+    And on the target dir we run the command: sh -c "rm -r 2*/ && mkdir 20200101000000_abcdef0_old"
+    And on the source dir we run the command: laika list
+    Then we should get status code 0 and the following output
+      """
+        20200101000000_abcdef0_old (invalid)
+
+      """
+
+  Scenario: Purge old builds concurrently
+    Given the fixture repository
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: sleep 1
+    And on the source dir we run the command: laika -q build main
+    And on the source dir we run the command: sleep 1
+    And on the source dir we run the command: laika -q build main
+    And on the source dir we run the command: laika -q purge --keep-latest 0 --jobs 2
+    And on the source dir we run the command: sh -c "laika list | wc -l && git worktree list | wc -l && ls -A ../target/.trash"
+    Then we should get status code 0 and the following output
+      """
+      1
+      2
+
+      """
+
+  Scenario: Purge old builds in the background
+    Given the fixture repository
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: sleep 1
+    And on the source dir we run the command: laika -q build main
+    And on the source dir we run the command: laika -q purge --keep-latest 0 --background
+    And on the source dir we run the command: sh -c "laika list | wc -l && while kill -0 $(cat ../target/.laika/reaper.pid 2>/dev/null) 2>/dev/null; do sleep 0.1; done && laika purge --status"
+    Then we should get status code 0 and the following output
+      """
+      1
+      0 builds awaiting removal (0 B)
+
+      """
+
+  Scenario: Check out only some directories
+    Given the fixture repository
+    Given the file app/main.txt is committed to the repository
+    Given the file docs/manual.txt is committed to the repository
+    Given the config option checkout.strategy is set to sparse
+    Given the config option checkout.paths is set to app
+    When on the source dir we run the command: laika -q deploy main
+    And on the deployment dir we run the command: sh -c "find . -name '*.txt' | sort"
+    Then we should get status code 0 and the following output
+      """
+      ./app/main.txt
+      ./hello.txt
+
+      """
+
+  Scenario: Export the tree without Git metadata
+    Given the fixture repository
+    Given the config option checkout.strategy is set to archive
+    When on the source dir we run the command: laika -q deploy main
+    And on the deployment dir we run the command: sh -c "ls -A | grep -v '^_'"
+    Then we should get status code 0 and the following output
+      """
+      deploy.ini
+      hello.txt
+
+      """
+
+  Scenario: Fetch only the ref being deployed
+    Given the fixture repository
+    Given the file remote.txt is pushed to the remote
+    Given the config option fetch.strategy is set to ref
+    When on the source dir we run the command: laika -q deploy origin/main
+    And on the deployment dir we run the command: ls remote.txt
+    Then we should get status code 0 and the following output
+      """
+      remote.txt
+
+      """
+
+  Scenario: List builds as JSON
+    Given the fixture repository
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: sh -c "laika --output json list | python3 -c 'import json, sys; e = json.loads(sys.stdin.read()); print(e[\"event\"], e[\"selected\"], e[\"meta\"][\"git_ref\"], e[\"meta\"][\"status\"])'"
+    Then we should get status code 0 and the following output
+      """
+      build True main succeeded
+
+      """
+
+  Scenario: Deploy one build to several targets
+    Given the fixture repository
+    Given the config option target:a.deploy is set to ../tenant-a
+    Given the config option target:b.deploy is set to ../tenant-b
+    Given the config option target:b.post_deploy is set to touch from-b.txt
+    When on the source dir we run the command: mkdir ../tenant-a ../tenant-b
+    And on the source dir we run the command: laika -q deploy --targets a,b main
+    And on the source dir we run the command: sh -c "ls ../tenant-a/current/ ../tenant-b/current/ && laika -t b list | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      ../tenant-a/current/:
+      _tree_meta.json
+      deploy.ini
+      hello.txt
+
+      ../tenant-b/current/:
+      _build.log
+      _tree_meta.json
+      deploy.ini
+      from-b.txt
+      hello.txt
+      1
+
+      """
+
+  Scenario: Build ahead and deploy the prepared build
+    Given the fixture repository
+    Given the config option build.reuse is set to true
+    When on the source dir we run the command: laika -q watch --once --no-fetch main
+    And on the source dir we run the command: laika -q deploy --no-fetch main
+    And on the target dir we run the command: sh -c "ls -d 2* | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      1
+
+      """
+
+  Scenario: Failed builds are flagged
+    Given the fixture repository
+    Given the build command is set to false
+    When on the source dir we run the command: laika -q build main
+    And on the source dir we run the command: sh -c "laika list | sed 's/^ *[0-9_]*[0-9a-f]*_main//'"
+    Then we should get status code 0 and the following output
+      """
+       (failed)
+
+      """
+
+  Scenario: Show the log of a build
+    Given the fixture repository
+    Given the build command is set to echo built from $DEPLOY_GIT_REF
+    When on the source dir we run the command: laika -q build main
+    And on the target dir we run the command: sh -c "laika -C ../source/deploy.ini logs $(ls -d 2*) | cut -d ' ' -f 2-"
+    Then we should get status code 0 and the following output
+      """
+      --- Running command: echo built from $DEPLOY_GIT_REF
+      built from main
+      --- Command exited with status 0
+
+      """
+
+  Scenario: Show the log of a build that does not exist
+    Given the fixture repository
+    When on the source dir we run the command: laika logs --follow nonexistent
+    Then we should get status code 1 and the following error output
+      """
+      ERROR: Build not found: nonexistent
+
+      """
+
+  Scenario: Builds that take too long are stopped and removed
+    Given the fixture repository
+    Given the build command is set to sleep 30
+    Given the config option build.timeout is set to 1
+    Given the config option build.remove_failed is set to true
+    When on the source dir we run the command: sh -c "laika -q build main 2>/dev/null; echo $?; laika list | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      1
+      0
+
+      """
+
+  Scenario: Build steps run after the steps they depend on
+    Given the fixture repository
+    Given the config option build.run is removed
+    Given the config option build.jobs is set to 2
+    Given the config option build:css.run is set to echo css > css.txt
+    Given the config option build:js.run is set to echo js > js.txt
+    Given the config option build:bundle.run is set to cat css.txt js.txt > bundle.txt
+    Given the config option build:bundle.after is set to css js
+    When on the source dir we run the command: laika -q deploy main
+    And on the deployment dir we run the command: cat bundle.txt
+    Then we should get status code 0 and the following output
+      """
+      css
+      js
+
+      """
+
+  Scenario: A failed build step stops the other steps
+    Given the fixture repository
+    Given the config option build.run is removed
+    Given the config option build.jobs is set to 2
+    Given the config option build:slow.run is set to sleep 30
+    Given the config option build:broken.run is set to false
+    Given the config option build:next.run is set to touch next.txt
+    Given the config option build:next.after is set to broken
+    When on the source dir we run the command: sh -c "laika -q build main 2>/dev/null; echo $?; ls ../target/2*/next.txt 2>/dev/null | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      1
+      0
+
+      """
+
+  Scenario: Build outputs are restored from the cache when the inputs are unchanged
+    Given the fixture repository
+    Given the build command is set to mkdir out && cp hello.txt out/copy.txt
+    Given the config option build.inputs is set to hello.txt
+    Given the config option build.outputs is set to out
+    When on the source dir we run the command: laika -q build main
+    And on the source dir we run the command: laika -q deploy main
+    And on the deployment dir we run the command: sh -c "cat out/copy.txt; grep -c 'Restored outputs' _build.log"
+    Then we should get status code 0 and the following output
+      """
+      hello world
+      1
+
+      """
+
+  Scenario: Identical files across builds are hard-linked
+    Given the fixture repository
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: laika -q build --rebuild main
+    And on the source dir we run the command: laika -q dedupe
+    And on the target dir we run the command: sh -c "stat -c %h 2*/hello.txt"
+    Then we should get status code 0 and the following output
+      """
+      2
+      2
+
+      """
+
+  Scenario: Purge builds that do not fit in the disk space budget
+    Given the fixture repository
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: laika -q build --rebuild main
+    And on the source dir we run the command: laika -q build --rebuild main
+    And on the source dir we run the command: sh -c "laika -q purge --max-size 0 && laika list | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      1
+
+      """
+
+  Scenario: Old builds are purged automatically after deploying
+    Given the fixture repository
+    Given the config option purge.auto is set to true
+    Given the config option purge.what is set to keep_latest 1
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: laika -q deploy --rebuild main
+    And on the source dir we run the command: laika -q deploy --rebuild main
+    And on the target dir we run the command: sh -c "ls -d 2* | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      2
+
+      """
+
+  Scenario: Each ref is deployed under its own link
+    Given the fixture repository
+    Given the config option deploy.link_per_ref is set to true
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: sh -c "git branch feature/x && laika -q deploy feature/x"
+    And on the source dir we run the command: laika -q purge --keep-latest 0
+    And on the target dir we run the command: sh -c "ls -d current* && ls -d 2* | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      current-feature--x
+      current-main
+      2
+
+      """
+
+  Scenario: The link of a ref is removed so that its builds can be purged
+    Given the fixture repository
+    Given the config option deploy.link_per_ref is set to true
+    When on the source dir we run the command: laika -q deploy main
+    And on the source dir we run the command: sh -c "git branch feature/x && laika -q deploy refs/heads/feature/x"
+    And on the source dir we run the command: laika -q unlink feature/x
+    And on the source dir we run the command: laika -q purge --keep-latest 0
+    And on the target dir we run the command: sh -c "ls -d current* && ls -d 2* | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      current-main
+      1
+
+      """
+
+  Scenario: Removing the link of a ref that was not deployed
+    Given the fixture repository
+    Given the config option deploy.link_per_ref is set to true
+    When on the source dir we run the command: laika unlink nonexistent
+    Then we should get status code 1 and the following error output
+      """
+      ERROR: No link for nonexistent: current-nonexistent
+
+      """
+
+  Scenario: Old builds are purged automatically after deploying to targets
+    Given the fixture repository
+    Given the config option purge.auto is set to true
+    Given the config option purge.what is set to keep_latest 1
+    Given the config option target:a.deploy is set to ../tenant-a
+    When on the source dir we run the command: mkdir ../tenant-a
+    And on the source dir we run the command: laika -q deploy --targets a main
+    And on the source dir we run the command: sh -c "sleep 1 && laika -q deploy --targets a --rebuild main"
+    And on the source dir we run the command: sh -c "sleep 1 && laika -q deploy --targets a --rebuild main"
+    And on the source dir we run the command: sh -c "ls -d ../target/2* | wc -l && ls -d ../tenant-a/2* | wc -l"
+    Then we should get status code 0 and the following output
+      """
+      1
+      2
+
+      """
@@ -5,6 +5,10 @@ from testing_helpers.fixtures.git import (
     set_build_command,
     set_post_deploy_command,
     set_shell,
+    set_config_option,
+    remove_config_option,
+    commit_file,
+    push_file_to_remote,
 )
 
 
@@ -41,3 +45,42 @@ def step_impl(context, shell):
     :type shell: str
     """
     set_shell(context, shell)
+
+
+@given("the config option {section}.{option} is set to {value}")
+def step_impl(context, section, option, value):
+    """
+    :type context: behave.runner.Context
+    :type section: str
+    :type option: str
+    :type value: str
+    """
+    set_config_option(context, section, option, value)
+
+
+@given("the config option {section}.{option} is removed")
+def step_impl(context, section, option):
+    """
+    :type context: behave.runner.Context
+    :type section: str
+    :type option: str
+    """
+    remove_config_option(context, section, option)
+
+
+@given("the file {path} is committed to the repository")
+def step_impl(context, path):
+    """
+    :type context: behave.runner.Context
+    :type path: str
+    """
+    commit_file(context, path)
+
+
+@given("the file {path} is pushed to the remote")
+def step_impl(context, path):
+    """
+    :type context: behave.runner.Context
+    :type path: str
+    """
+    push_file_to_remote(context, path)
@@ -1,3 +1,6 @@
+import sys
+
+
 def _get_version(package_name: str) -> str:
     try:
         from importlib.metadata import version
@@ -10,4 +13,13 @@ def _get_version(package_name: str) -> str:
     return version(package_name)
 
 
-__version__ = _get_version("laika-deploy")
+def __getattr__(name: str):
+    # Looking up the version is slow, so it is only done when needed
+    if name == "__version__":
+        return _get_version("laika-deploy")
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # Module-level __getattr__ is only supported since Python 3.7
+    __version__ = _get_version("laika-deploy")
@@ -0,0 +1,154 @@
+import contextlib
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from .fs import copy_path
+from .trash import remove_tree
+
+# Directory under the deploy root where the outputs of build steps are kept
+CACHE_DIR = ".cache"
+
+
+def cache_dir(deploy_root: Path) -> Path:
+    return deploy_root / CACHE_DIR
+
+
+def _mark_used(entry: Path):
+    # The modification time of an entry tells when it was last used
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(str(entry))
+
+
+def unused_entries(deploy_root: Path, since: float) -> List[Path]:
+    """
+    The cache entries that have not been used since the given time (a Unix
+    timestamp), such as the creation time of the oldest build.
+    """
+    try:
+        entries = list(cache_dir(deploy_root).iterdir())
+    except FileNotFoundError:
+        return []
+
+    unused = []
+    for entry in entries:
+        # Entries still being stored are hidden
+        if entry.name.startswith("."):
+            continue
+        try:
+            if entry.stat().st_mtime < since:
+                unused.append(entry)
+        except FileNotFoundError:
+            continue
+    return unused
+
+
+def _input_files(build_dir: Path, patterns: Sequence[str]):
+    files = set()
+    for pattern in patterns:
+        for path in build_dir.glob(pattern):
+            relative = path.relative_to(build_dir)
+            if relative.parts[0] == ".git":
+                continue
+            if path.is_file():
+                files.add(relative)
+    return sorted(files)
+
+
+def step_cache_key(
+    command: str,
+    inputs: Sequence[str],
+    outputs: Sequence[str],
+    build_dir: Path,
+    shell: Optional[str] = None,
+) -> str:
+    """
+    A digest of the command of a build step, the paths of its outputs and
+    the names and contents of the files matching its input patterns.
+    """
+    digest = hashlib.sha256()
+    for part in [shell or "", command] + list(outputs):
+        digest.update(part.encode("utf-8") + b"\0")
+
+    for relative in _input_files(build_dir, inputs):
+        digest.update(str(relative).encode("utf-8") + b"\0")
+        with (build_dir / relative).open("rb") as stream:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def _remove_path(path: Path):
+    if path.is_dir() and not path.is_symlink():
+        remove_tree(path)
+    elif path.exists() or path.is_symlink():
+        path.unlink()
+
+
+def restore_outputs(
+    key: str, outputs: Sequence[str], deploy_root: Path, build_dir: Path
+) -> bool:
+    """
+    Copy the outputs stored under `key` into the build, replacing anything
+    already at their paths. Returns False if nothing is stored under `key`,
+    or if it could not be copied, leaving none of the outputs behind.
+    """
+    entry = cache_dir(deploy_root) / key
+    if not entry.is_dir():
+        return False
+    _mark_used(entry)
+
+    try:
+        for output in outputs:
+            target = build_dir / output
+            _remove_path(target)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            copy_path(entry / output, target, method="reflink")
+    except OSError:
+        # The entry may have been evicted by `laika purge` in the meantime
+        for output in outputs:
+            _remove_path(build_dir / output)
+        return False
+
+    return True
+
+
+def save_outputs(
+    key: str, outputs: Sequence[str], deploy_root: Path, build_dir: Path
+) -> bool:
+    """
+    Store copies of the outputs of a build step under `key`. Returns False
+    if any of the outputs is missing, in which case nothing is stored.
+    """
+    if not all(os.path.lexists(str(build_dir / output)) for output in outputs):
+        return False
+
+    entry = cache_dir(deploy_root) / key
+    if entry.exists():
+        _mark_used(entry)
+        return True
+
+    # Fill a temporary directory first so that no incomplete entry is ever
+    # visible, even if several builds store the same entry at once
+    partial = cache_dir(deploy_root) / (
+        ".%s.%d.%d" % (key, os.getpid(), threading.get_ident())
+    )
+    partial.mkdir(parents=True)
+    try:
+        for output in outputs:
+            (partial / output).parent.mkdir(parents=True, exist_ok=True)
+            copy_path(build_dir / output, partial / output, method="reflink")
+        os.rename(partial, entry)
+        _mark_used(entry)
+    except OSError:
+        if not entry.exists():
+            raise
+    finally:
+        if partial.exists():
+            remove_tree(partial)
+
+    return True
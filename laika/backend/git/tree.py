@@ -1,11 +1,170 @@
+import contextlib
 import datetime
 import os
+import re
 import subprocess
+import tarfile
 from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
 
-from laika.core import BuildMeta, BuildMetaFile, Build
-from laika.git import git_rev_parse_short, git_rev_parse, normalize_refname
+from laika.core import (
+    DEFAULT_REMOTE,
+    BuildMeta,
+    BuildMetaFile,
+    Build,
+    BuildStatus,
+    FetchSettings,
+    build_command_line,
+    build_index,
+    using_build,
+)
+from laika.git import (
+    GitRevisionParseFail,
+    normalize_refname,
+    resolve_commit,
+    run_git,
+    traced,
+)
 from laika.output import Reporter
+from laika.purge import remove_build
+from laika.trash import remove_tree
+
+
+_COMMIT_HASH_PATTERN = re.compile(r"^[0-9a-f]{4,40}$")
+
+
+def _fetch_options(settings: Optional[FetchSettings]) -> List[str]:
+    options = []
+    if settings is not None and settings.depth is not None:
+        options += ["--depth", str(settings.depth)]
+    if settings is not None and settings.filter is not None:
+        options += ["--filter=" + settings.filter]
+    return options
+
+
+def fetch_from_remote(
+    git_dir: Path, reporter: Reporter, settings: Optional[FetchSettings] = None
+):
+    remote = settings.remote if settings is not None else None
+    reporter.info("Fetching from %s" % (remote or "default remote"))
+    run_git(
+        ["fetch"] + _fetch_options(settings) + build_command_line([remote]),
+        gitdir=git_dir,
+        stdout=reporter.subprocess_stdout,
+    ).check_returncode()
+
+
+def _refspec_for(git_ref: str, remote: str) -> str:
+    prefix = remote + "/"
+    if git_ref.startswith(prefix):
+        branch = git_ref[len(prefix) :]
+        return "+refs/heads/{branch}:refs/remotes/{remote}/{branch}".format(
+            branch=branch, remote=remote
+        )
+    if git_ref.startswith("refs/tags/"):
+        return "+{ref}:{ref}".format(ref=git_ref)
+    return git_ref
+
+
+def fetch_ref(
+    git_ref: str, git_dir: Path, reporter: Reporter, settings: FetchSettings
+) -> Optional[Tuple[str, str]]:
+    """
+    Fetch only the given ref from the remote. Fetching is skipped if the ref
+    is a commit hash that is already present locally, in which case its
+    resolved hashes are returned.
+    """
+    if _COMMIT_HASH_PATTERN.match(git_ref):
+        try:
+            resolved = resolve_commit(git_ref, gitdir=git_dir)
+        except GitRevisionParseFail:
+            pass
+        else:
+            if resolved[0].startswith(git_ref):
+                reporter.info("Commit %s is present locally; not fetching" % git_ref)
+                return resolved
+
+    remote = settings.remote or DEFAULT_REMOTE
+    refspec = _refspec_for(git_ref, remote)
+
+    reporter.info("Fetching %s from %s" % (git_ref, remote))
+    run_git(
+        ["fetch"] + _fetch_options(settings) + [remote, refspec],
+        gitdir=git_dir,
+        stdout=reporter.subprocess_stdout,
+    ).check_returncode()
+    return None
+
+
+def _register_worktree(path: Path, git_hash: str, git_dir: Path, reporter: Reporter):
+    """Add a worktree at an empty directory, without checking out any files."""
+    options = ["--no-checkout"]
+    if reporter.quiet:
+        options += ["--quiet"]
+
+    run_git(
+        ["worktree", "add"] + options + ["--detach", str(path), git_hash],
+        gitdir=git_dir,
+        stdout=reporter.subprocess_stdout,
+    ).check_returncode()
+
+
+def _check_out_worktree(
+    path: Path, git_hash: str, reporter: Reporter, sparse_paths=None,
+):
+    if sparse_paths is not None:
+        # Sparse checkout settings are specific to the new worktree
+        run_git(
+            ["sparse-checkout", "set", "--cone"] + list(sparse_paths),
+            gitdir=path,
+            stdout=reporter.subprocess_stdout,
+        ).check_returncode()
+    run_git(
+        ["checkout", "--quiet", "--detach", git_hash],
+        gitdir=path,
+        stdout=reporter.subprocess_stdout,
+    ).check_returncode()
+
+
+def _export_archive(path: Path, git_hash: str, git_dir: Path, paths: Sequence[str]):
+    cmd = ["git", "archive", "--format=tar", git_hash]
+    if paths:
+        cmd += ["--"] + list(paths)
+
+    with traced(cmd), subprocess.Popen(
+        cmd, cwd=git_dir, stdout=subprocess.PIPE
+    ) as proc:
+        try:
+            with tarfile.open(fileobj=proc.stdout, mode="r|") as archive:
+                archive.extractall(str(path))
+        except tarfile.ReadError:
+            # Git writes no archive when it fails, and its error (already
+            # shown on stderr) is more useful than the one from tarfile
+            if proc.wait() != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd) from None
+            raise
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def _reserve_build_dir(
+    deploy_root: Path, timestamp: datetime.datetime, hash: str, git_ref: str
+) -> Tuple[str, Path]:
+    """Create the directory of a new build, returning its ID and path."""
+    id_timestamp = timestamp
+    while True:
+        build_id = "{timestamp:%Y%m%d%H%M%S}_{hash}_{refname}".format(
+            timestamp=id_timestamp, hash=hash, refname=normalize_refname(git_ref),
+        )
+        path = deploy_root / build_id
+        try:
+            path.mkdir()
+        except FileExistsError:
+            # A build of the same commit was started within the same second
+            id_timestamp += datetime.timedelta(seconds=1)
+        else:
+            return build_id, path
 
 
 def checkout_tree_for_build(
@@ -14,21 +173,60 @@ def checkout_tree_for_build(
     git_ref: str,
     git_dir: Path,
     reporter: Reporter,
+    build_key: Optional[str] = None,
+    strategy: str = "worktree",
+    paths: Sequence[str] = (),
+    resolved_hashes: Optional[Tuple[str, str]] = None,
+    locks: Optional[contextlib.ExitStack] = None,
 ):
+    """
+    Create a new build directory with the tree of the given Git ref, using
+    one of the following strategies:
+
+    - `worktree`: a Git worktree with the full tree;
+    - `sparse`: a Git worktree with only the given `paths` (cone patterns)
+      checked out;
+    - `archive`: a plain copy of the tree (or only the given `paths`),
+      without any Git metadata.
+
+    `resolved_hashes` may hold the full and abbreviated hashes of `git_ref`
+    if they are already known. If `locks` is given, the new build is marked
+    as in use (see `using_build`) until it is closed.
+    """
     if fetch_first:
-        # TODO: Allow fetching from different remote or from --all
-        reporter.info("Fetching from default remote")
-        subprocess.run(["git", "fetch"], cwd=git_dir).check_returncode()
+        fetch_from_remote(git_dir, reporter)
 
-    hash = git_rev_parse_short(git_ref, git_dir)
-    full_hash = git_rev_parse(git_ref, git_dir)
+    if resolved_hashes is None:
+        resolved_hashes = resolve_commit(git_ref, gitdir=git_dir)
+    full_hash, hash = resolved_hashes
     timestamp = datetime.datetime.utcnow()
 
-    build_id = "{timestamp:%Y%m%d%H%M%S}_{hash}_{refname}".format(
-        timestamp=timestamp, hash=hash, refname=normalize_refname(git_ref),
+    meta = BuildMeta(
+        source_path=os.path.realpath(git_dir),
+        git_ref=git_ref,
+        git_hash=full_hash,
+        timestamp=timestamp,
+        build_key=build_key,
+        status=BuildStatus.pending,
     )
 
-    path = deploy_root / build_id
+    # Only reserving the build directory is done while the deploy root is
+    # locked; the slow part of the checkout is not
+    with build_index(deploy_root).updating() as index_entries:
+        build_id, path = _reserve_build_dir(deploy_root, timestamp, hash, git_ref)
+        build = Build(build_id, path, meta)
+        if locks is not None:
+            locks.enter_context(using_build(build))
+
+        try:
+            # Worktrees must not be added while `git worktree prune` runs
+            if strategy != "archive":
+                _register_worktree(path, full_hash, git_dir, reporter)
+            BuildMetaFile.write(path, meta)
+        except BaseException:
+            remove_tree(path)
+            raise
+        index_entries[build_id] = meta.to_dict()
 
     reporter.info(
         "Checking out git ref {git_ref} at directory {path}".format(
@@ -36,21 +234,15 @@ def checkout_tree_for_build(
         )
     )
 
-    options = []
-    if reporter.quiet:
-        options += ["--quiet"]
-
-    subprocess.run(
-        ["git", "worktree", "add"] + options + ["--detach", str(path), git_ref],
-        cwd=git_dir,
-    ).check_returncode()
-
-    meta = BuildMeta(
-        source_path=os.path.realpath(git_dir),
-        git_ref=git_ref,
-        git_hash=full_hash,
-        timestamp=timestamp,
-    )
-    BuildMetaFile.write(path, meta)
+    try:
+        if strategy == "archive":
+            _export_archive(path, full_hash, git_dir, paths)
+        elif strategy == "sparse":
+            _check_out_worktree(path, full_hash, reporter, sparse_paths=paths)
+        else:
+            _check_out_worktree(path, full_hash, reporter)
+    except BaseException:
+        remove_build(build, deploy_root, git_dir, reporter)
+        raise
 
-    return Build(build_id, path, meta)
+    return build
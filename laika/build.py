@@ -0,0 +1,122 @@
+import contextlib
+import subprocess
+from typing import Optional
+
+from laika.backend.git.tree import checkout_tree_for_build, fetch_from_remote, fetch_ref
+from laika.core import (
+    Build,
+    BuildMeta,
+    Config,
+    find_reusable_build,
+    list_builds,
+    run_build,
+    using_build,
+)
+from laika.dedupe import dedupe_builds
+from laika.dependencies import seed_dependencies
+from laika.git import resolve_commit
+from laika.output import Reporter
+from laika.purge import remove_build
+from laika.timing import PhaseTimer
+from laika.units import format_size
+
+
+def prepare_build(
+    git_ref: str,
+    fetch_first: bool,
+    reuse: bool,
+    config: Config,
+    reporter: Reporter,
+    locks: Optional[contextlib.ExitStack] = None,
+    git_hash: Optional[str] = None,
+) -> Build:
+    """
+    Check out and build the given Git ref, or the commit `git_hash` if given
+    (which `git_ref` was resolved to earlier). If `reuse` is set, a previous
+    successful build of the same commit with the same build settings is
+    returned instead, if there is one.
+
+    The build is marked as in use (see `using_build`), so that it is not
+    purged, until `locks` is closed, or until it is ready if not given.
+    """
+    if locks is None:
+        with contextlib.ExitStack() as locks:
+            return prepare_build(
+                git_ref, fetch_first, reuse, config, reporter, locks, git_hash
+            )
+
+    timer = PhaseTimer()
+
+    resolved = None
+    if fetch_first:
+        fetch_settings = config.fetch_settings
+        with timer.phase("fetch"):
+            if fetch_settings.strategy == "ref":
+                resolved = fetch_ref(git_ref, config.git_dir, reporter, fetch_settings)
+            else:
+                fetch_from_remote(config.git_dir, reporter, fetch_settings)
+
+    build_key = config.build_key
+    # The ref may have moved since it was resolved to `git_hash`
+    if resolved is None or git_hash is not None:
+        with timer.phase("resolve"):
+            resolved = resolve_commit(git_hash or git_ref, gitdir=config.git_dir)
+    git_hash = resolved[0]
+
+    if reuse:
+        builds = list_builds(config.deploy_root, allow_invalid=False)
+        cached = find_reusable_build(builds, git_hash, build_key)
+        if cached is not None:
+            locks.enter_context(using_build(cached))
+            # It may have been purged in the meantime
+            if cached.path.is_dir():
+                reporter.success(
+                    "Reusing build %s of commit %s" % (cached.build_id, git_hash)
+                )
+                return cached
+
+    with timer.phase("checkout"):
+        build = checkout_tree_for_build(
+            deploy_root=config.deploy_root,
+            fetch_first=False,
+            git_ref=git_ref,
+            git_dir=config.git_dir,
+            reporter=reporter,
+            build_key=build_key,
+            strategy=config.checkout_strategy,
+            paths=config.checkout_paths,
+            resolved_hashes=resolved,
+            locks=locks,
+        )
+
+    if config.dependency_caches:
+        with timer.phase("dependencies"):
+            seed_dependencies(build, list_builds(config.deploy_root), config, reporter)
+
+    # Saved along with the build status
+    assert isinstance(build.meta, BuildMeta)
+    build.meta.timings.update(timer.timings)
+
+    try:
+        run_build(build, config, reporter)
+    except (
+        subprocess.CalledProcessError,
+        subprocess.TimeoutExpired,
+        KeyboardInterrupt,
+    ):
+        if config.remove_failed_builds:
+            remove_build(build, config.deploy_root, config.git_dir, reporter)
+        raise
+
+    if config.dedupe_after_build:
+        builds = list_builds(config.deploy_root, allow_invalid=False)
+        result = dedupe_builds(
+            builds,
+            {b.build_id for b in builds if b.build_id != build.build_id},
+            reporter,
+        )
+        reporter.info(
+            "Linked %d files to previous builds, reclaiming %s"
+            % (result.files_linked, format_size(result.bytes_reclaimed))
+        )
+    return build
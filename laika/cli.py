@@ -1,22 +1,47 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import shlex
+import subprocess
 import sys
 
+import laika
 import laika.commands
-from . import __version__
-from .core import Config, Reporter, ConfigFileNotFound, TerminateApplication
-
-
-def _build_parser(default_no_color=None):
+import laika.git
+import laika.lock
+from .core import (
+    Config,
+    ConfigError,
+    ConfigFileNotFound,
+    Reporter,
+    TerminateApplication,
+)
+from .output import JsonReporter
+
+
+class _VersionAction(argparse.Action):
+    """Like the `version` action, but only looks up the version when used."""
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, help=None):
+        super().__init__(
+            option_strings=option_strings,
+            dest=dest,
+            default=argparse.SUPPRESS,
+            nargs=0,
+            help=help,
+        )
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        print(laika.__version__)
+        parser.exit()
+
+
+def _build_parser(default_no_color=None, command=None):
     parser = argparse.ArgumentParser()
-    parser.set_defaults(func=None)
+    parser.set_defaults(func=None, command=None)
 
     parser.add_argument(
-        "--version",
-        action="version",
-        version=__version__,
-        help="show the program version and exit",
+        "--version", action=_VersionAction, help="show the program version and exit",
     )
 
     parser.add_argument(
@@ -46,29 +71,99 @@ def _build_parser(default_no_color=None):
         """,
     )
 
+    parser.add_argument(
+        "-t",
+        "--target",
+        metavar="NAME",
+        help="""
+            operate on the deploy root of this target (configured in a
+            [target:NAME] section) instead of dirs.deploy
+        """,
+    )
+
+    parser.add_argument(
+        "--output",
+        choices=["text", "json"],
+        default="text",
+        help="""
+            output format: human-readable text, or one JSON object per line
+            (default: %(default)s)
+        """,
+    )
+
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="""
+            show diagnostic output, such as the time taken by each Git command
+        """,
+    )
+
+    parser.add_argument(
+        "--lock-timeout",
+        metavar="SECONDS",
+        type=float,
+        help="""
+            give up after waiting this long for other laika processes to
+            release the deploy root (default: general.lock_timeout, or wait
+            indefinitely)
+        """,
+    )
+
     subparsers = parser.add_subparsers(help="sub-commands")
 
-    for module in laika.commands.find_available_command_modules():
-        module.register(subparsers)
+    laika.commands.register_commands(subparsers, selected=command)
 
     return parser
 
 
+def _build_reporter(args) -> Reporter:
+    if args.output == "json":
+        return JsonReporter(quiet=args.quiet, verbose=args.verbose)
+
+    return Reporter(color=args.color, quiet=args.quiet, verbose=args.verbose)
+
+
 def main():
     # See: https://no-color.org/
     default_no_color = os.getenv("NO_COLOR") is not None
 
+    # Find out which command was selected, then build the parser again with
+    # the arguments of that command only
     parser = _build_parser(default_no_color=default_no_color)
+    args, _ = parser.parse_known_args()
+    if args.command is not None:
+        parser = _build_parser(default_no_color=default_no_color, command=args.command)
 
     args = parser.parse_args()
 
-    reporter = Reporter(color=args.color, quiet=args.quiet)
+    reporter = _build_reporter(args)
+
+    if args.verbose:
+        laika.git.add_tracer(
+            lambda cmd, elapsed: reporter.debug(
+                "%s (%.1f ms)" % (" ".join(map(shlex.quote, cmd)), elapsed * 1000)
+            )
+        )
+
     try:
         config = Config.read(args.config_file)
     except ConfigFileNotFound as e:
-        print("ERROR: Config file not found: %s" % e.args)
+        reporter.error("Config file not found: %s" % e.args)
         sys.exit(2)
 
+    if args.target is not None:
+        try:
+            config = config.for_target(args.target)
+        except ConfigError as e:
+            reporter.error(str(e))
+            sys.exit(2)
+
+    laika.lock.set_default_timeout(
+        args.lock_timeout if args.lock_timeout is not None else config.lock_timeout
+    )
+
     if args.func is None:
         parser.print_usage()
         sys.exit(1)
@@ -77,6 +172,15 @@ def main():
         args.func(args, config, reporter)
     except TerminateApplication as e:
         sys.exit(e.status)
+    except (
+        subprocess.CalledProcessError,
+        subprocess.TimeoutExpired,
+        laika.lock.LockTimeout,
+    ) as e:
+        reporter.error(str(e))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        sys.exit(130)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,37 @@
 import importlib
-import pkgutil
-
-
-def find_available_command_modules():
-    commands_path = __path__  # type: ignore  # mypy issue #1422
-    modules = (
-        importlib.import_module("laika.commands.%s" % module_info.name)
-        for module_info in pkgutil.iter_modules(commands_path)
-    )
-    return (
-        module
-        for module in modules
-        if hasattr(module, "register") and callable(getattr(module, "register"))
-    )
+
+# The commands and their help, so that the argument parser can be built
+# without importing every command module (and their dependencies). Each
+# command is implemented by the module of the same name in this package.
+COMMANDS = {
+    "build": "prepare a new build from a Git ref",
+    "dedupe": "replace identical files across builds with hard links to save space",
+    "deploy": "prepare a build and deploy it",
+    "list": "list all prepared builds",
+    "logs": "show the output of the commands run on a build",
+    "purge": "remove old builds",
+    "reindex": "rebuild the index of prepared builds from scratch",
+    "select": "deploy an already prepared build",
+    "stats": "show how long each phase of past builds took",
+    "unlink": "remove the links of refs deployed with deploy.link_per_ref",
+    "watch": "build new commits of some Git refs as soon as they appear",
+}
+
+
+def load_command_module(name: str):
+    return importlib.import_module("laika.commands.%s" % name)
+
+
+def register_commands(subparsers, selected=None):
+    """
+    Add the sub-parser of each command. Only the module of the `selected`
+    command is imported, to register its arguments; the other commands get
+    placeholder sub-parsers, which only serve to find out which command was
+    selected and to list the commands in the help.
+    """
+    for name, help in COMMANDS.items():
+        if name == selected:
+            load_command_module(name).register(subparsers)
+        else:
+            placeholder = subparsers.add_parser(name, help=help, add_help=False)
+            placeholder.set_defaults(command=name)
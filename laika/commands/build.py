@@ -1,8 +1,7 @@
-from laika.backend.git.tree import checkout_tree_for_build
+from laika.build import prepare_build
 from laika.core import (
     Config,
     Reporter,
-    run_build,
     TerminateApplication,
 )
 from laika.git import GitRevisionParseFail
@@ -11,14 +10,14 @@ from laika.git import GitRevisionParseFail
 def cmd_build(args, config: Config, reporter: Reporter):
     reporter.info("Selecting git repository %s" % config.git_dir)
     try:
-        build = checkout_tree_for_build(
-            deploy_root=config.deploy_root,
-            fetch_first=args.fetch_first,
+        build = prepare_build(
             git_ref=args.ref,
-            git_dir=config.git_dir,
+            fetch_first=args.fetch_first,
+            reuse=config.reuse_builds and not args.rebuild,
+            config=config,
             reporter=reporter,
         )
-        run_build(build, config, reporter)
+        reporter.output("build", None, **build.to_dict())
     except GitRevisionParseFail:
         reporter.error(f"Invalid git reference: {args.ref}")
         raise TerminateApplication(1)
@@ -35,4 +34,9 @@ def register(subparsers):
         action="store_false",
         help="don't fetch from remote before running Git commands",
     )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="always prepare a new build, even if a previous build can be reused",
+    )
     parser.set_defaults(func=cmd_build)
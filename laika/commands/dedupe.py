@@ -0,0 +1,44 @@
+from laika.core import Config, Reporter, list_builds
+from laika.dedupe import dedupe_builds
+from laika.units import format_size, positive_int
+
+
+def cmd_dedupe(args, config: Config, reporter: Reporter):
+    builds = list_builds(config.deploy_root, allow_invalid=False)
+    protected = builds.selected_ids()
+
+    reporter.info("Looking for identical files in %s" % config.deploy_root)
+    if args.dry_run:
+        reporter.info("Dry-run; not going to link anything")
+
+    result = dedupe_builds(
+        builds, protected, reporter, dry_run=args.dry_run, jobs=args.jobs
+    )
+
+    reporter.success(
+        "Linked {files} files, reclaiming {size}".format(
+            files=result.files_linked, size=format_size(result.bytes_reclaimed)
+        )
+    )
+    reporter.output("dedupe", None, **result._asdict())
+
+
+def register(subparsers):
+    parser = subparsers.add_parser(
+        "dedupe",
+        help="replace identical files across builds with hard links to save space",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only report how much space would be reclaimed",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=positive_int,
+        default=1,
+        help="how many groups of files to compare concurrently (default: %(default)s)",
+    )
+    parser.set_defaults(func=cmd_dedupe)
@@ -1,29 +1,63 @@
-from laika.backend.git.tree import checkout_tree_for_build
+import contextlib
+
+from laika.build import prepare_build
 from laika.core import (
     Config,
+    ConfigError,
     Reporter,
-    run_build,
     deploy_prepared_build,
     TerminateApplication,
 )
+from laika.commands.purge import purge_after_deploy
 from laika.git import GitRevisionParseFail
+from laika.targets import deploy_to_targets
 
 
 def cmd_deploy(args, config: Config, reporter: Reporter):
+    targets = []
+    if args.targets:
+        try:
+            targets = [config.for_target(name) for name in args.targets.split(",")]
+        except ConfigError as e:
+            reporter.error(str(e))
+            raise TerminateApplication(1)
+
     reporter.info("Selecting git repository %s" % config.git_dir)
-    try:
-        build = checkout_tree_for_build(
-            deploy_root=config.deploy_root,
-            fetch_first=args.fetch_first,
-            git_ref=args.ref,
-            git_dir=config.git_dir,
-            reporter=reporter,
-        )
-        run_build(build, config, reporter)
-        deploy_prepared_build(build, config, reporter)
-    except GitRevisionParseFail:
-        reporter.error(f"Invalid git reference: {args.ref}")
-        raise TerminateApplication(1)
+    # Keeps the build from being purged until it is deployed
+    with contextlib.ExitStack() as locks:
+        try:
+            build = prepare_build(
+                git_ref=args.ref,
+                fetch_first=args.fetch_first,
+                reuse=config.reuse_builds and not args.rebuild,
+                config=config,
+                reporter=reporter,
+                locks=locks,
+            )
+            reporter.output("build", None, **build.to_dict())
+            if targets:
+                failed = deploy_to_targets(build, targets, reporter)
+                for target in targets:
+                    if target.name not in failed:
+                        purge_after_deploy(target, reporter)
+                # Builds are prepared in the main deploy root before being
+                # copied to the targets, so they pile up there too
+                if not any(
+                    target.deploy_root.samefile(config.deploy_root)
+                    for target in targets
+                ):
+                    purge_after_deploy(config, reporter)
+                if failed:
+                    reporter.error(
+                        "Deployment failed for targets: %s" % ", ".join(failed)
+                    )
+                    raise TerminateApplication(1)
+            else:
+                deploy_prepared_build(build, config, reporter)
+                purge_after_deploy(config, reporter)
+        except GitRevisionParseFail:
+            reporter.error(f"Invalid git reference: {args.ref}")
+            raise TerminateApplication(1)
 
 
 def register(subparsers):
@@ -37,4 +71,17 @@ def register(subparsers):
         action="store_false",
         help="don't fetch from remote before running Git commands",
     )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="always prepare a new build, even if a previous build can be reused",
+    )
+    parser.add_argument(
+        "--targets",
+        metavar="NAME[,NAME...]",
+        help="""
+            build once, then deploy the build to each of these targets
+            (configured in [target:NAME] sections) concurrently
+        """,
+    )
     parser.set_defaults(func=cmd_deploy)
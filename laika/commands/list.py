@@ -1,4 +1,12 @@
-from laika.core import Config, Reporter, list_builds, Build
+from laika.core import (
+    CURRENT_LINK,
+    Config,
+    Reporter,
+    list_builds,
+    Build,
+    BuildMeta,
+    BuildStatus,
+)
 
 
 def cmd_list(args, config: Config, reporter: Reporter):
@@ -6,19 +14,38 @@ def cmd_list(args, config: Config, reporter: Reporter):
         flags = []
         if build.is_metadata_missing():
             flags.append("(invalid)")
+        elif isinstance(build.meta, BuildMeta) and build.meta.status in (
+            BuildStatus.pending,
+            BuildStatus.failed,
+        ):
+            flags.append("(%s)" % build.meta.status.value)
 
         if flags:
             return " " + " ".join(flags)
         return ""
 
+    def format_links(links) -> str:
+        # Only worth showing when builds are deployed under per-ref links
+        links = [link for link in links if link != CURRENT_LINK]
+        if links:
+            return " -> " + ", ".join(links)
+        return ""
+
     builds = list_builds(config.deploy_root)
     for build in sorted(builds, key=lambda build: build.build_id):
-        print(
-            "{selected:<1s} {id}{flags}".format(
-                selected="*" if builds.is_selected(build) else "",
+        selected = builds.is_selected(build)
+        links = builds.links_to(build)
+        reporter.output(
+            "build",
+            "{selected:<1s} {id}{flags}{links}".format(
+                selected="*" if selected else "",
                 id=build.build_id,
                 flags=format_flags(build),
-            )
+                links=format_links(links),
+            ),
+            selected=selected,
+            links=links,
+            **build.to_dict(),
         )
 
 
@@ -0,0 +1,50 @@
+import os
+import sys
+
+from laika.core import Config, Reporter, TerminateApplication, load_build
+from laika.logs import follow_log, read_log
+
+
+def _write(data: bytes):
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
+
+
+def cmd_logs(args, config: Config, reporter: Reporter):
+    build_id = args.build_id
+    # Build IDs name directories directly under the deploy root
+    if os.sep in build_id or build_id.startswith("."):
+        build = None
+    else:
+        build = load_build(build_id, config.deploy_root)
+
+    if build is None or not build.path.is_dir():
+        reporter.error("Build not found: %s" % build_id)
+        raise TerminateApplication(1)
+
+    if not args.follow:
+        for data in read_log(build.path):
+            _write(data)
+        return
+
+    for data in read_log(build.path, include_current=False):
+        _write(data)
+    try:
+        for data in follow_log(build.path):
+            _write(data)
+    except KeyboardInterrupt:
+        pass
+
+
+def register(subparsers):
+    parser = subparsers.add_parser(
+        "logs", help="show the output of the commands run on a build"
+    )
+    parser.add_argument("build_id", help="the build whose log to show")
+    parser.add_argument(
+        "-f",
+        "--follow",
+        action="store_true",
+        help="keep showing the log as it is written, until interrupted",
+    )
+    parser.set_defaults(func=cmd_logs)
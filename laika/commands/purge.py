@@ -1,56 +1,184 @@
 import argparse
+import datetime
+import re
+import subprocess
 import sys
 from typing import Optional
 
-import dateparser  # type: ignore
-
-from laika.core import Config, Reporter
+from laika.core import Config, Reporter, TerminateApplication
 from laika.purge import PurgeSpecification, purge_deployments
+from laika.timeparse import parse_relative_time
+from laika.trash import trash_status
+from laika.units import format_size, non_negative_int, parse_size, positive_int
 
 
 def cmd_purge(args, config: Config, reporter: Reporter):
-    what_to_purge = _find_what_to_purge(args, config)
+    if args.status:
+        show_trash_status(config, reporter)
+        return
+
+    jobs = args.jobs if args.jobs is not None else config.purge_jobs
+    what_to_purge = _find_what_to_purge(args, config, jobs)
     if what_to_purge is None:
         reporter.error("No valid purge settings found")
         sys.exit(1)
 
     reporter.info("Selecting git repository %s" % config.git_dir)
 
-    purge_deployments(
+    failed = purge_deployments(
         deploy_root=config.deploy_root,
         dry_run=args.dry_run,
         what_to_purge=what_to_purge,
         git_dir=config.git_dir,
         reporter=reporter,
+        jobs=jobs,
+        background=args.background or config.purge_background,
+    )
+    if failed:
+        reporter.error("%d builds could not be removed" % len(failed))
+        raise TerminateApplication(1)
+
+
+def purge_after_deploy(config: Config, reporter: Reporter):
+    """
+    Remove the builds selected by `purge.what`, if `purge.auto` is enabled.
+    Failures are reported but do not fail the deployment.
+    """
+    if not config.purge_auto:
+        return
+
+    jobs = config.purge_jobs
+    try:
+        what_to_purge = parse_deployments_specification(config.purge_what or "", jobs)
+    except Exception:
+        reporter.error("Not purging old builds: no valid purge.what setting")
+        return
+
+    try:
+        failed = purge_deployments(
+            deploy_root=config.deploy_root,
+            dry_run=False,
+            what_to_purge=what_to_purge,
+            git_dir=config.git_dir,
+            reporter=reporter,
+            jobs=jobs,
+            background=config.purge_background,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        reporter.error("Failed to purge old builds: %s" % e)
+        return
+
+    if failed:
+        reporter.error("%d builds could not be removed" % len(failed))
+
+
+def show_trash_status(config: Config, reporter: Reporter):
+    status = trash_status(config.deploy_root)
+
+    text = "{entries} builds awaiting removal ({size})".format(
+        entries=status.entries, size=format_size(status.size)
     )
+    if status.reaper_pid is not None:
+        text += "\nBackground removal in progress (PID %d)" % status.reaper_pid
+
+    reporter.output("trash", text, **status._asdict())
 
 
-def _find_what_to_purge(args, config: Config) -> Optional[PurgeSpecification]:
+def _find_what_to_purge(
+    args, config: Config, jobs: int = 1
+) -> Optional[PurgeSpecification]:
     if args.keep_latest is not None:
         return PurgeSpecification.keep_latest(args.keep_latest)
     elif args.older_than is not None:
         return PurgeSpecification.discard_older_than(args.older_than)
+    elif args.max_size is not None:
+        return PurgeSpecification.keep_under_size(args.max_size, jobs)
 
     if config.purge_what is None:
         return None
 
     try:
-        return parse_deployments_specification(config.purge_what)
+        return parse_deployments_specification(config.purge_what, jobs)
     except Exception:
         return None
 
 
-def parse_deployments_specification(spec: str) -> PurgeSpecification:
+def _parse_single_specification(spec: str, jobs: int) -> PurgeSpecification:
     spec_type, value = spec.split(" ", 1)
     if spec_type == "keep_latest":
         return PurgeSpecification.keep_latest(non_negative_int(value))
     elif spec_type == "older_than":
         return PurgeSpecification.discard_older_than(relative_time(value))
+    elif spec_type == "max_size":
+        return PurgeSpecification.keep_under_size(size(value), jobs)
+    elif spec_type == "latest_per_ref":
+        return PurgeSpecification.keep_latest_per_ref(value)
 
     raise ValueError("invalid specification")
 
 
+def parse_deployments_specification(spec: str, jobs: int = 1) -> PurgeSpecification:
+    """
+    Parse a specification such as `keep_latest 5`, or several of them
+    combined with `or` (keep what any of them keeps), `and` (keep what all
+    of them keep) and parentheses, e.g.:
+
+        (keep_latest 5 or older_than 3d or latest_per_ref v*) and max_size 30G
+    """
+    tokens = re.findall(r"[()]|[^\s()]+", spec)
+    position = 0
+
+    def peek() -> Optional[str]:
+        return tokens[position] if position < len(tokens) else None
+
+    def parse_any_of() -> PurgeSpecification:
+        nonlocal position
+        specs = [parse_all_of()]
+        while peek() == "or":
+            position += 1
+            specs.append(parse_all_of())
+        return specs[0] if len(specs) == 1 else PurgeSpecification.any_of(*specs)
+
+    def parse_all_of() -> PurgeSpecification:
+        nonlocal position
+        specs = [parse_term()]
+        while peek() == "and":
+            position += 1
+            specs.append(parse_term())
+        return specs[0] if len(specs) == 1 else PurgeSpecification.all_of(*specs)
+
+    def parse_term() -> PurgeSpecification:
+        nonlocal position
+        if peek() == "(":
+            position += 1
+            spec = parse_any_of()
+            if peek() != ")":
+                raise ValueError("missing closing parenthesis")
+            position += 1
+            return spec
+
+        words = []
+        while peek() not in (None, "(", ")", "and", "or"):
+            words.append(tokens[position])
+            position += 1
+        if len(words) < 2:
+            raise ValueError("invalid specification")
+        return _parse_single_specification(" ".join(words), jobs)
+
+    what_to_purge = parse_any_of()
+    if peek() is not None:
+        raise ValueError("unexpected %r" % peek())
+    return what_to_purge
+
+
 def relative_time(string):
+    parsed = parse_relative_time(string)
+    if parsed is not None:
+        return parsed
+
+    # Other formats are handled by dateparser, which is slow to import
+    import dateparser  # type: ignore
+
     parsed = dateparser.parse(
         string, settings={"PREFER_DATES_FROM": "past", "TIMEZONE": "UTC",}
     )
@@ -59,15 +187,18 @@ def relative_time(string):
             "%r could not be parsed as a date/time" % string
         )
 
-    return parsed
+    # Build timestamps are naive UTC datetimes
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
 
+    return parsed
 
-def non_negative_int(string):
-    value = int(string)
-    if value < 0:
-        raise argparse.ArgumentTypeError("%r is negative" % string)
 
-    return value
+def size(string):
+    try:
+        return parse_size(string)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
 
 def register(subparsers):
@@ -78,6 +209,28 @@ def register(subparsers):
         help="don't remove anything, only print what would be removed",
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=positive_int,
+        help="remove up to N builds concurrently (default: purge.jobs, or 1)",
+    )
+
+    parser.add_argument(
+        "--background",
+        action="store_true",
+        help="""
+            move the selected builds out of the way and remove them in a
+            detached, low-priority background process (default: purge.background)
+        """,
+    )
+    parser.add_argument(
+        "--status",
+        action="store_true",
+        help="show how much data is still awaiting removal, and exit",
+    )
+
     which = parser.add_mutually_exclusive_group()
     which.add_argument(
         "--older-than",
@@ -91,5 +244,14 @@ def register(subparsers):
         type=non_negative_int,
         help="keep this amount of latest deployments (besides the current one)",
     )
+    which.add_argument(
+        "--max-size",
+        metavar="SIZE",
+        type=size,
+        help="""
+            keep as many of the latest deployments (besides the current one)
+            as fit in this amount of disk space, such as 20G
+        """,
+    )
 
     parser.set_defaults(func=cmd_purge)
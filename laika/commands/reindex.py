@@ -0,0 +1,15 @@
+from laika.core import Config, Reporter, build_index
+
+
+def cmd_reindex(args, config: Config, reporter: Reporter):
+    reporter.info("Scanning builds in %s" % config.deploy_root)
+    entries = build_index(config.deploy_root).rebuild()
+    reporter.success("Indexed %d builds" % len(entries))
+    reporter.output("reindex", None, builds=len(entries))
+
+
+def register(subparsers):
+    parser = subparsers.add_parser(
+        "reindex", help="rebuild the index of prepared builds from scratch"
+    )
+    parser.set_defaults(func=cmd_reindex)
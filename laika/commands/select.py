@@ -1,7 +1,5 @@
 import sys
 
-import inquirer  # type: ignore
-
 from laika.core import (
     Config,
     Reporter,
@@ -22,6 +20,9 @@ def cmd_select(args, config: Config, reporter: Reporter):
 
         build_ids = sorted([build.build_id for build in builds], reverse=True)
 
+        # Only needed in interactive mode, and slow to import
+        import inquirer  # type: ignore
+
         questions = [
             inquirer.List(
                 "deploy_id",
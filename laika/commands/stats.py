@@ -0,0 +1,75 @@
+from laika.core import BuildMeta, Config, Reporter, list_builds
+from laika.timing import summarize_timings
+from laika.units import positive_int
+
+
+def _format_duration(seconds: float) -> str:
+    return "%.2fs" % seconds
+
+
+def _format_trend(trend) -> str:
+    if trend is None:
+        return "-"
+    return "%+.0f%%" % (trend * 100)
+
+
+def cmd_stats(args, config: Config, reporter: Reporter):
+    builds = sorted(
+        (build for build in list_builds(config.deploy_root, allow_invalid=False)),
+        key=lambda build: build.build_id,
+    )
+    timings = [
+        build.meta.timings
+        for build in builds
+        if isinstance(build.meta, BuildMeta) and build.meta.timings
+    ]
+    if args.last is not None:
+        timings = timings[-args.last :]
+
+    if not timings:
+        reporter.error("No builds with timing information")
+        return
+
+    row = "{:<14s} {:>6s} {:>9s} {:>9s} {:>9s} {:>7s}"
+    reporter.output(None, row.format("phase", "builds", "p50", "p95", "last", "trend"))
+    for stats in summarize_timings(timings, window=args.window):
+        reporter.output(
+            "phase",
+            row.format(
+                stats.phase,
+                str(stats.count),
+                _format_duration(stats.p50),
+                _format_duration(stats.p95),
+                _format_duration(stats.last),
+                _format_trend(stats.trend),
+            ),
+            phase=stats.phase,
+            builds=stats.count,
+            p50=stats.p50,
+            p95=stats.p95,
+            last=stats.last,
+            trend=stats.trend,
+        )
+
+
+def register(subparsers):
+    parser = subparsers.add_parser(
+        "stats", help="show how long each phase of past builds took"
+    )
+    parser.add_argument(
+        "--last",
+        metavar="N",
+        type=positive_int,
+        help="only consider the N most recent builds",
+    )
+    parser.add_argument(
+        "--window",
+        metavar="N",
+        type=positive_int,
+        default=10,
+        help="""
+            compare the median of the N most recent builds to the N builds
+            before them to compute the trend (default: %(default)s)
+        """,
+    )
+    parser.set_defaults(func=cmd_stats)
@@ -0,0 +1,44 @@
+import os
+
+from laika.core import (
+    DEFAULT_REMOTE,
+    Config,
+    Reporter,
+    TerminateApplication,
+    build_index,
+    ref_link_name,
+)
+
+
+def cmd_unlink(args, config: Config, reporter: Reporter):
+    remote = config.fetch_settings.remote or DEFAULT_REMOTE
+    failed = False
+    for ref in args.refs:
+        link_name = ref_link_name(ref, remote)
+        link = config.deploy_root / link_name
+        with build_index(config.deploy_root).updating():
+            if not link.is_symlink():
+                reporter.error("No link for %s: %s" % (ref, link_name))
+                failed = True
+                continue
+            build_id = os.readlink(str(link))
+            link.unlink()
+
+        reporter.success("Removed %s, which pointed to %s" % (link_name, build_id))
+        reporter.output("unlinked", None, link=link_name, build_id=build_id)
+
+    if failed:
+        raise TerminateApplication(1)
+
+
+def register(subparsers):
+    parser = subparsers.add_parser(
+        "unlink", help="remove the links of refs deployed with deploy.link_per_ref",
+    )
+    parser.add_argument(
+        "refs",
+        metavar="REF",
+        nargs="+",
+        help="a ref whose link to remove, such as a deleted branch",
+    )
+    parser.set_defaults(func=cmd_unlink)
@@ -0,0 +1,72 @@
+from laika.core import Config, Reporter, TerminateApplication
+from laika.units import positive_int
+from laika.watch import Watcher
+
+
+def cmd_watch(args, config: Config, reporter: Reporter):
+    refs = args.refs or config.watch_refs
+    if not refs:
+        reporter.error("No refs to watch; give them as arguments or in watch.refs")
+        raise TerminateApplication(1)
+
+    if not config.reuse_builds:
+        reporter.info(
+            "Note: build.reuse is not enabled, so 'laika deploy' will not pick "
+            "up builds prepared by this command; use 'laika select' instead"
+        )
+
+    watcher = Watcher(
+        refs,
+        config,
+        reporter,
+        jobs=args.jobs if args.jobs is not None else config.watch_jobs,
+    )
+    reporter.info("Watching %s" % ", ".join(refs))
+    try:
+        watcher.run(
+            interval=(
+                args.interval if args.interval is not None else config.watch_interval
+            ),
+            fetch_first=args.fetch_first,
+            trigger_file=config.watch_trigger_file,
+            once=args.once,
+        )
+    except KeyboardInterrupt:
+        raise TerminateApplication(130)
+
+
+def register(subparsers):
+    parser = subparsers.add_parser(
+        "watch", help="build new commits of some Git refs as soon as they appear"
+    )
+    parser.add_argument(
+        "refs",
+        nargs="*",
+        metavar="ref",
+        help="the Git refs to watch (default: watch.refs)",
+    )
+    parser.add_argument(
+        "--interval",
+        metavar="SECONDS",
+        type=float,
+        help="how often to check for new commits (default: watch.interval, or 60)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=positive_int,
+        help="run up to N builds concurrently (default: watch.jobs, or 1)",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="check for new commits only once, and wait for their builds",
+    )
+    parser.add_argument(
+        "--no-fetch",
+        dest="fetch_first",
+        action="store_false",
+        help="don't fetch from remote before checking for new commits",
+    )
+    parser.set_defaults(func=cmd_watch)
@@ -1,17 +1,58 @@
 import configparser
+import contextlib
 import datetime
+import hashlib
 import json
 import os
 import subprocess
+from enum import Enum
 from pathlib import Path
-from typing import Optional, Sequence
-
-import pytz
-
+from typing import (
+    TYPE_CHECKING,
+    ContextManager,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+)
+
+from .artifacts import restore_outputs, save_outputs, step_cache_key
+from .fs import LINK_METHODS, shared_disk_usage
+from .index import BuildIndex, build_lock_path
+from .lock import shared_lock
+from .logs import BuildLog, stream_command
 from .output import Reporter
+from .process import (
+    IONICE_CLASSES,
+    ProcessGroups,
+    ResourceLimits,
+    limited_command,
+)
+from .timing import PhaseTimer
+from .units import parse_size
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
 
 DEFAULT_SECTION = "general"
 
+# The link to the deployed build, or the prefix of the link to the build
+# deployed for each ref (see `Config.link_per_ref`)
+CURRENT_LINK = "current"
+
+CHECKOUT_STRATEGIES = ("worktree", "sparse", "archive")
+FETCH_STRATEGIES = ("remote", "ref")
+
+# Fetched from by the `ref` strategy unless `fetch.remote` is set
+DEFAULT_REMOTE = "origin"
+
+TARGET_PREFIX = "target:"
+BUILD_STEP_PREFIX = "build:"
+DEFAULT_CHECKOUT_STRATEGY = "worktree"
+
 
 class ConfigError(RuntimeError):
     pass
@@ -25,6 +66,33 @@ class BuildNotFound(RuntimeError):
     pass
 
 
+class DependencyCacheSpec(NamedTuple):
+    path: str
+    key_files: List[str]
+    method: str
+
+
+class FetchSettings(NamedTuple):
+    strategy: str
+    remote: Optional[str]
+    depth: Optional[int]
+    filter: Optional[str]
+
+
+class BuildStep(NamedTuple):
+    name: str
+    command: str
+    after: List[str]
+    inputs: List[str] = []
+    outputs: List[str] = []
+
+
+class LogSettings(NamedTuple):
+    max_size: int
+    backups: int
+    compress: bool
+
+
 class Config:
     def __init__(self, config: configparser.ConfigParser):
         self.config = config
@@ -44,25 +112,262 @@ class Config:
     def build_command(self) -> str:
         return self.config["build"]["run"]
 
+    @property
+    def build_steps(self) -> List[BuildStep]:
+        """
+        The steps of the build, declared in `[build:NAME]` sections, or a
+        single step running `build.run`.
+        """
+        steps = [
+            self._build_step(section[len(BUILD_STEP_PREFIX) :], section)
+            for section in self.config.sections()
+            if section.startswith(BUILD_STEP_PREFIX)
+        ]
+        if not steps:
+            return [self._build_step("build", "build")._replace(after=[])]
+
+        if self.config.has_option("build", "run"):
+            raise ConfigError("build.run cannot be combined with [build:NAME] steps")
+
+        names = {step.name for step in steps}
+        for step in steps:
+            unknown = [name for name in step.after if name not in names]
+            if unknown:
+                raise ConfigError(
+                    "unknown steps in build:%s.after: %s"
+                    % (step.name, ", ".join(unknown))
+                )
+
+        _check_build_step_cycles(steps)
+        return steps
+
+    def _build_step(self, name: str, section_name: str) -> BuildStep:
+        section = self.config[section_name]
+        outputs = section.get("outputs", "").split()
+        for path in outputs:
+            if os.path.isabs(path) or ".." in Path(path).parts:
+                raise ConfigError(
+                    "build step outputs must be relative to the build: %s" % path
+                )
+
+        inputs = section.get("inputs", "").split()
+        # Otherwise the step would be cached without any effect, and skipped
+        # from then on
+        if inputs and not outputs:
+            raise ConfigError("%s.inputs requires outputs to be set" % section_name)
+
+        return BuildStep(
+            name=name,
+            command=section["run"],
+            after=section.get("after", "").split(),
+            inputs=inputs,
+            outputs=outputs,
+        )
+
+    @property
+    def build_jobs(self) -> int:
+        return self.config.getint("build", "jobs", fallback=1)
+
+    @property
+    def build_key(self) -> str:
+        """
+        A digest of everything besides the source tree that determines the
+        outcome of a build, used to tell whether an existing build can be
+        reused for the same commit.
+        """
+        steps = self.build_steps
+        if len(steps) == 1 and not self.config.has_section(
+            BUILD_STEP_PREFIX + steps[0].name
+        ):
+            parts = [self.shell or "", steps[0].command]
+        else:
+            parts = [self.shell or ""]
+            for step in steps:
+                parts += [step.name, step.command, " ".join(step.after)]
+        if self.checkout_strategy != DEFAULT_CHECKOUT_STRATEGY:
+            parts += [self.checkout_strategy] + self.checkout_paths
+
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+    @property
+    def checkout_strategy(self) -> str:
+        strategy = self.config.get(
+            "checkout", "strategy", fallback=DEFAULT_CHECKOUT_STRATEGY
+        )
+        if strategy not in CHECKOUT_STRATEGIES:
+            raise ConfigError("invalid checkout strategy: %s" % strategy)
+        return strategy
+
+    @property
+    def checkout_paths(self) -> List[str]:
+        return self.config.get("checkout", "paths", fallback="").split()
+
+    @property
+    def fetch_settings(self) -> FetchSettings:
+        strategy = self.config.get("fetch", "strategy", fallback="remote")
+        if strategy not in FETCH_STRATEGIES:
+            raise ConfigError("invalid fetch strategy: %s" % strategy)
+
+        return FetchSettings(
+            strategy=strategy,
+            remote=self.config.get("fetch", "remote", fallback=None),
+            depth=self.config.getint("fetch", "depth", fallback=None),
+            filter=self.config.get("fetch", "filter", fallback=None),
+        )
+
+    @property
+    def reuse_builds(self) -> bool:
+        return self.config.getboolean("build", "reuse", fallback=False)
+
+    @property
+    def dependency_caches(self) -> List[DependencyCacheSpec]:
+        prefix = "dependency_cache:"
+        specs = []
+        for section in self.config.sections():
+            if not section.startswith(prefix):
+                continue
+
+            path = section[len(prefix) :]
+            if os.path.isabs(path) or ".." in Path(path).parts:
+                raise ConfigError(
+                    "dependency cache path must be relative to the build: %s" % path
+                )
+
+            method = self.config.get(section, "method", fallback="reflink")
+            if method not in LINK_METHODS:
+                raise ConfigError(
+                    "invalid method for dependency cache %s: %s" % (path, method)
+                )
+
+            specs.append(
+                DependencyCacheSpec(
+                    path=path,
+                    key_files=self.config.get(section, "key_files").split(),
+                    method=method,
+                )
+            )
+        return specs
+
     @property
     def post_deploy_command(self) -> Optional[str]:
         return self.config.get("post_deploy", "run", fallback=None)
 
+    def resource_limits(self, section_name: str) -> ResourceLimits:
+        """Limits for the command in the `build` or `post_deploy` section."""
+        if not self.config.has_section(section_name):
+            return ResourceLimits()
+        section = self.config[section_name]
+
+        try:
+            memory_limit = section.get("memory_limit")
+            limits = ResourceLimits(
+                timeout=section.getfloat("timeout"),
+                cpu_limit=section.getint("cpu_limit"),
+                memory_limit=parse_size(memory_limit) if memory_limit else None,
+                nice=section.getint("nice"),
+                ionice=section.get("ionice"),
+            )
+        except ValueError as e:
+            raise ConfigError("invalid resource limit in [%s]: %s" % (section_name, e))
+
+        if limits.ionice is not None and limits.ionice not in IONICE_CLASSES:
+            raise ConfigError("invalid %s.ionice: %s" % (section_name, limits.ionice))
+        return limits
+
+    @property
+    def dedupe_after_build(self) -> bool:
+        return self.config.getboolean("build", "dedupe", fallback=False)
+
+    @property
+    def remove_failed_builds(self) -> bool:
+        return self.config.getboolean("build", "remove_failed", fallback=False)
+
+    @property
+    def log_settings(self) -> LogSettings:
+        section = self.config["logs"]
+        try:
+            max_size = parse_size(section.get("max_size", "10M"))
+        except ValueError as e:
+            raise ConfigError("invalid logs.max_size: %s" % e)
+        return LogSettings(
+            max_size=max_size,
+            backups=section.getint("backups", fallback=3),
+            compress=section.getboolean("compress", fallback=False),
+        )
+
+    @property
+    def link_per_ref(self) -> bool:
+        return self.config.getboolean("deploy", "link_per_ref", fallback=False)
+
     @property
     def purge_what(self) -> Optional[str]:
         return self.config["purge"].get("what")
 
+    @property
+    def purge_jobs(self) -> int:
+        return self.config["purge"].getint("jobs", fallback=1)
+
+    @property
+    def purge_auto(self) -> bool:
+        return self.config["purge"].getboolean("auto", fallback=False)
+
+    @property
+    def purge_background(self) -> bool:
+        return self.config["purge"].getboolean("background", fallback=False)
+
+    @property
+    def watch_refs(self) -> List[str]:
+        return self.config.get("watch", "refs", fallback="").split()
+
+    @property
+    def watch_interval(self) -> float:
+        return self.config.getfloat("watch", "interval", fallback=60.0)
+
+    @property
+    def watch_jobs(self) -> int:
+        jobs = self.config.getint("watch", "jobs", fallback=1)
+        if jobs < 1:
+            raise ConfigError("invalid watch.jobs: %d is not positive" % jobs)
+        return jobs
+
+    @property
+    def watch_trigger_file(self) -> Optional[Path]:
+        trigger_file = self.config.get("watch", "trigger_file", fallback=None)
+        if trigger_file is None:
+            return None
+        return self._get_dir(trigger_file)
+
     @property
     def shell(self) -> Optional[str]:
         return self.config[DEFAULT_SECTION].get("shell")
 
+    @property
+    def lock_timeout(self) -> Optional[float]:
+        return self.config[DEFAULT_SECTION].getfloat("lock_timeout", fallback=None)
+
+    @property
+    def target_names(self) -> List[str]:
+        return [
+            section[len(TARGET_PREFIX) :]
+            for section in self.config.sections()
+            if section.startswith(TARGET_PREFIX)
+        ]
+
+    def for_target(self, name: str) -> "TargetConfig":
+        if not self.config.has_section(TARGET_PREFIX + name):
+            raise ConfigError("unknown target: %s" % name)
+        return TargetConfig(self.config, name)
+
     @classmethod
     def read(cls, filename):
         config = configparser.ConfigParser(default_section=DEFAULT_SECTION)
 
         # defaults
         config.read_dict(
-            {"dirs": {"git": ".",}, "purge": {},}
+            {"dirs": {"git": ".",}, "purge": {}, "logs": {},}
         )
 
         config_files = [filename]
@@ -72,6 +377,56 @@ class Config:
         return cls(config)
 
 
+def _check_build_step_cycles(steps: List[BuildStep]):
+    after = {step.name: step.after for step in steps}
+    done: set = set()
+
+    def visit(name, path):
+        if name in path:
+            cycle = path[path.index(name) :] + [name]
+            raise ConfigError(
+                "build steps depend on each other: %s" % " -> ".join(cycle)
+            )
+        if name in done:
+            return
+        for dependency in after[name]:
+            visit(dependency, path + [name])
+        done.add(name)
+
+    for step in steps:
+        visit(step.name, [])
+
+
+class TargetConfig(Config):
+    """
+    The configuration for deploying to a named target, which has its own
+    deploy root and, optionally, its own post-deploy command.
+    """
+
+    def __init__(self, config: configparser.ConfigParser, name: str):
+        super().__init__(config)
+        self.name = name
+
+    @property
+    def _section(self):
+        return self.config[TARGET_PREFIX + self.name]
+
+    @property
+    def deploy_root(self) -> Path:
+        return self._get_dir(self._section["deploy"])
+
+    @property
+    def post_deploy_command(self) -> Optional[str]:
+        return self._section.get("post_deploy", super().post_deploy_command)
+
+    @property
+    def replication_method(self) -> str:
+        method = self._section.get("method", "reflink")
+        if method not in LINK_METHODS:
+            raise ConfigError("invalid method for target %s: %s" % (self.name, method))
+        return method
+
+
 class TerminateApplication(RuntimeError):
     def __init__(self, status: int):
         super().__init__(status)
@@ -79,25 +434,78 @@ class TerminateApplication(RuntimeError):
 
 
 class _BaseBuildMeta:
-    pass
+    __slots__ = ()
 
 
 class MissingBuildMeta(_BaseBuildMeta):
-    pass
+    __slots__ = ()
+
+
+_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _parse_timestamp(string: str) -> datetime.datetime:
+    """Parse a timestamp in `_TIMESTAMP_FORMAT`, faster than `strptime`."""
+    if (
+        len(string) == 20
+        and string[4] == string[7] == "-"
+        and string[10] == "T"
+        and string[13] == string[16] == ":"
+        and string[19] == "Z"
+    ):
+        try:
+            return datetime.datetime(
+                int(string[0:4]),
+                int(string[5:7]),
+                int(string[8:10]),
+                int(string[11:13]),
+                int(string[14:16]),
+                int(string[17:19]),
+            )
+        except ValueError:
+            pass
+    return datetime.datetime.strptime(string, _TIMESTAMP_FORMAT)
+
+
+class BuildStatus(Enum):
+    pending = "pending"
+    succeeded = "succeeded"
+    failed = "failed"
 
 
 class BuildMeta(_BaseBuildMeta):
+    __slots__ = (
+        "source_path",
+        "git_ref",
+        "git_hash",
+        "timestamp",
+        "build_key",
+        "status",
+        "timings",
+        "size",
+    )
+
     def __init__(
         self,
         source_path: str,
         git_ref: str,
         git_hash: str,
         timestamp: datetime.datetime,
+        build_key: Optional[str] = None,
+        status: Optional[BuildStatus] = None,
+        timings: Optional[Dict[str, float]] = None,
+        size: Optional[int] = None,
     ):
         self.source_path = source_path
         self.git_ref = git_ref
         self.git_hash = git_hash
         self.timestamp = timestamp
+        self.build_key = build_key
+        self.status = status
+        # Duration in seconds of each phase of the build and its latest deployment
+        self.timings = timings if timings is not None else {}
+        # Disk space in bytes used by the build once completed
+        self.size = size
 
     @classmethod
     def from_dict(cls, d: dict):
@@ -105,27 +513,39 @@ class BuildMeta(_BaseBuildMeta):
         version = d.pop("version", "0")
 
         d["source_path"] = d.pop("source_path", None)
-        d["timestamp"] = datetime.datetime.strptime(
-            d["timestamp"], "%Y-%m-%dT%H:%M:%SZ"
-        )
+        d["timestamp"] = _parse_timestamp(d["timestamp"])
 
         if version == "0":
             d["git_hash"] = d.pop("hash", None)
 
+        if d.get("status") is not None:
+            d["status"] = BuildStatus(d["status"])
+
         return cls(**d)
 
     def to_dict(self):
-        timestamp = self.timestamp.astimezone(pytz.utc)
+        timestamp = self.timestamp
+        # Naive timestamps are already in UTC
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(datetime.timezone.utc)
         return dict(
-            version="1",
+            version="4",
             source_path=self.source_path,
             git_ref=self.git_ref,
             git_hash=self.git_hash,
-            timestamp=timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            timestamp=timestamp.strftime(_TIMESTAMP_FORMAT),
+            build_key=self.build_key,
+            status=self.status.value if self.status is not None else None,
+            timings={
+                phase: round(seconds, 3) for phase, seconds in self.timings.items()
+            },
+            size=self.size,
         )
 
 
 class Build:
+    __slots__ = ("build_id", "path", "meta")
+
     def __init__(self, build_id: str, path: Path, meta: _BaseBuildMeta):
         self.build_id = build_id
         self.path = path
@@ -140,11 +560,31 @@ class Build:
     def is_metadata_missing(self) -> bool:
         return isinstance(self.meta, MissingBuildMeta)
 
+    def to_dict(self):
+        return dict(
+            build_id=self.build_id,
+            path=str(self.path),
+            meta=self.meta.to_dict() if isinstance(self.meta, BuildMeta) else None,
+        )
+
+    def is_reusable_for(self, git_hash: str, build_key: str) -> bool:
+        if not isinstance(self.meta, BuildMeta):
+            return False
+
+        return (
+            self.meta.status == BuildStatus.succeeded
+            and self.meta.git_hash == git_hash
+            and self.meta.build_key == build_key
+        )
+
 
 class Builds:
-    def __init__(self, builds, current_id):
+    def __init__(self, builds, links: Dict[str, str]):
         self.builds = builds
-        self.current_id = current_id
+        # Build ID pointed to by each link, such as `current`
+        self.links = links
+        self.current_id = links.get(CURRENT_LINK)
+        self._selected_ids = set(links.values())
 
     def __iter__(self):
         return iter(self.builds)
@@ -153,7 +593,15 @@ class Builds:
         return bool(self.builds)
 
     def is_selected(self, build):
-        return build.build_id == self.current_id
+        return build.build_id in self._selected_ids
+
+    def selected_ids(self) -> Set[str]:
+        return set(self._selected_ids)
+
+    def links_to(self, build) -> List[str]:
+        return sorted(
+            name for name, build_id in self.links.items() if build_id == build.build_id
+        )
 
 
 class BuildMetaFile:
@@ -162,12 +610,12 @@ class BuildMetaFile:
     @classmethod
     def read(cls, build_dir: Path) -> BuildMeta:
         file_path = build_dir / cls._PATH
-        if not file_path.exists():
+        try:
+            with file_path.open() as stream:
+                return BuildMeta.from_dict(json.load(stream))
+        except FileNotFoundError:
             raise BuildNotFound(f"Build metadata file not found: {file_path}")
 
-        with file_path.open() as stream:
-            return BuildMeta.from_dict(json.load(stream))
-
     @classmethod
     def write(cls, build_dir: Path, meta: BuildMeta):
         file_path = build_dir / cls._PATH
@@ -175,6 +623,26 @@ class BuildMetaFile:
             json.dump(meta.to_dict(), stream)
 
 
+def build_index(deploy_root: Path) -> BuildIndex:
+    return BuildIndex(deploy_root, BuildMetaFile._PATH)
+
+
+def using_build(build: Build) -> ContextManager[None]:
+    """
+    Mark a build as in use (e.g. while it is being built or deployed) for
+    the duration of the block, so that it is not purged.
+    """
+    return shared_lock(build_lock_path(build.path.parent, build.build_id))
+
+
+def save_build_meta(build: Build):
+    assert isinstance(build.meta, BuildMeta)
+
+    with build_index(build.path.parent).updating() as entries:
+        BuildMetaFile.write(build.path, build.meta)
+        entries[build.build_id] = build.meta.to_dict()
+
+
 def build_command_line(args):
     return [arg for arg in args if arg is not None]
 
@@ -189,11 +657,39 @@ def build_shell_command(command: str, config: Config) -> Sequence[str]:
     return [shell, "-c", command]
 
 
+def open_build_log(build: Build, config: Config) -> BuildLog:
+    settings = config.log_settings
+    return BuildLog(
+        build.path,
+        max_size=settings.max_size,
+        backups=settings.backups,
+        compress=settings.compress,
+    )
+
+
 def run_command_on_build(
-    command: str, build: Build, config: Config, reporter: Reporter
+    command: str,
+    build: Build,
+    config: Config,
+    reporter: Reporter,
+    limits: ResourceLimits = ResourceLimits(),
+    log: Optional[BuildLog] = None,
+    prefix: str = "",
+    groups: Optional[ProcessGroups] = None,
 ):
+    """
+    Run a command on the build directory. Its output is shown as it is
+    produced, with `prefix` on every line, and also appended to the build
+    log.
+    """
+    if log is None:
+        with open_build_log(build, config) as log:
+            return run_command_on_build(
+                command, build, config, reporter, limits, log, prefix, groups
+            )
+
     reporter.info("Changing directory to %s" % build.path)
-    reporter.info("Running command: %s" % command)
+    reporter.info("%sRunning command: %s" % (prefix, command))
 
     assert isinstance(build.meta, BuildMeta)
 
@@ -205,16 +701,146 @@ def run_command_on_build(
         "DEPLOY_GIT_HASH": build.meta.git_hash,
     }
 
-    subprocess.run(
-        build_shell_command(command, config),
-        cwd=build.path,
-        env=hydrated_environment,
-        check=True,
-    )
+    shell_command = build_shell_command(command, config)
+
+    log.write_message("%sRunning command: %s" % (prefix, command))
+    try:
+        returncode = stream_command(
+            limited_command(shell_command, limits),
+            reporter.subprocess_stdout,
+            log,
+            prefix=prefix,
+            timeout=limits.timeout,
+            groups=groups,
+            cwd=build.path,
+            env=hydrated_environment,
+        )
+    except subprocess.TimeoutExpired as e:
+        message = "%sCommand timed out after %g seconds" % (prefix, e.timeout)
+        log.write_message(message)
+        reporter.error(message)
+        raise
+    except KeyboardInterrupt:
+        log.write_message("%sCommand interrupted" % prefix)
+        raise
+    log.write_message("%sCommand exited with status %d" % (prefix, returncode))
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, shell_command)
+
+
+def run_build_steps(build: Build, config: Config, reporter: Reporter):
+    """
+    Run the steps of the build, each one as soon as the steps it depends on
+    have succeeded, up to `build.jobs` at a time. When a step fails, the
+    other running steps are terminated and no other step is started.
+
+    Steps that declare their inputs are skipped when their outputs for the
+    same inputs are found in the cache, and their outputs are cached
+    otherwise.
+    """
+    # Not imported at the top, as it takes a while and most commands do not
+    # need it
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    steps = config.build_steps
+    limits = config.resource_limits("build")
+    groups = ProcessGroups()
+
+    def run_step(step: BuildStep, log: BuildLog):
+        prefix = "[%s] " % step.name if len(steps) > 1 else ""
+
+        key = None
+        if step.inputs:
+            key = step_cache_key(
+                step.command, step.inputs, step.outputs, build.path, config.shell
+            )
+            if restore_outputs(key, step.outputs, config.deploy_root, build.path):
+                message = "%sRestored outputs from the cache (%s)" % (prefix, key[:12])
+                reporter.info(message)
+                log.write_message(message)
+                return
+
+        run_command_on_build(
+            step.command, build, config, reporter, limits, log, prefix, groups
+        )
+
+        if key is not None:
+            if not save_outputs(key, step.outputs, config.deploy_root, build.path):
+                reporter.info("%sNot caching outputs: some are missing" % prefix)
+
+    pending = {step.name: step for step in steps}
+    done: set = set()
+    running: Dict["Future", BuildStep] = {}
+
+    with open_build_log(build, config) as log, ThreadPoolExecutor(
+        max_workers=max(config.build_jobs, 1)
+    ) as executor:
+        try:
+            while pending or running:
+                ready = [
+                    step
+                    for step in pending.values()
+                    if all(name in done for name in step.after)
+                ]
+                for step in ready:
+                    del pending[step.name]
+                    running[executor.submit(run_step, step, log)] = step
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    try:
+                        future.result()
+                    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+                        reporter.error("Build step %s failed" % step.name)
+                        raise
+                    done.add(step.name)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            groups.terminate_all()
+            raise
 
 
 def run_build(build: Build, config: Config, reporter: Reporter):
-    run_command_on_build(config.build_command, build, config, reporter)
+    assert isinstance(build.meta, BuildMeta)
+
+    try:
+        with PhaseTimer(build.meta.timings).phase("build"):
+            run_build_steps(build, config, reporter)
+    except (
+        subprocess.CalledProcessError,
+        subprocess.TimeoutExpired,
+        KeyboardInterrupt,
+    ):
+        build.meta.status = BuildStatus.failed
+        raise
+    else:
+        build.meta.status = BuildStatus.succeeded
+        unshared, shared = shared_disk_usage(build.path)
+        # Files with several links may also be counted in other builds, so
+        # only sizes that do not depend on other builds are recorded
+        build.meta.size = None if shared else unshared
+    finally:
+        save_build_meta(build)
+
+
+def find_reusable_build(
+    builds: Iterable[Build], git_hash: str, build_key: str
+) -> Optional[Build]:
+    """
+    Find the most recent successful build of the given commit that was built
+    with the same build settings.
+    """
+    candidates = [
+        build for build in builds if build.is_reusable_for(git_hash, build_key)
+    ]
+    if not candidates:
+        return None
+
+    # Build IDs start with the build timestamp
+    return max(candidates, key=lambda build: build.build_id)
 
 
 def get_build(build_path: Path) -> Build:
@@ -226,40 +852,101 @@ def get_build(build_path: Path) -> Build:
     return Build(build_path.name, build_path, meta)
 
 
-def list_builds(deploy_path: Path, allow_invalid=True) -> Builds:
-    build_paths = sorted(
-        d for d in deploy_path.iterdir() if not d.is_symlink() and d.is_dir()
+def _build_from_index_entry(path: Path, entry: Optional[dict]) -> Build:
+    meta: _BaseBuildMeta
+    if entry is None:
+        meta = MissingBuildMeta()
+    else:
+        meta = BuildMeta.from_dict(entry)
+    return Build(path.name, path, meta)
+
+
+def _is_current_link(name: str) -> bool:
+    # Normalized refs have no dots, unlike the temporary `.new` links
+    return name == CURRENT_LINK or (
+        name.startswith(CURRENT_LINK + "-") and "." not in name
     )
 
-    def resolve_current_build(build):
-        if build.is_symlink():
-            if not build.is_dir():
+
+def current_links(deploy_path: Path) -> Dict[str, str]:
+    """
+    The build ID pointed to by the `current` link and by each per-ref
+    `current-<ref>` link in the deploy root.
+    """
+    links = {}
+    with os.scandir(deploy_path) as it:
+        for entry in it:
+            if not _is_current_link(entry.name):
+                continue
+
+            if not entry.is_symlink():
                 raise RuntimeError(
-                    "current build is not symlink to dir: {}".format(build)
+                    "current build must be symlink to sibling directory: {}".format(
+                        entry.path
+                    )
+                )
+
+            link = Path(entry.path)
+            if not link.is_dir():
+                raise RuntimeError(
+                    "current build is not symlink to dir: {}".format(link)
                 )
-            target = build.resolve(strict=True)
+            target = link.resolve(strict=True)
             if not target.parent.samefile(deploy_path):
                 raise RuntimeError(
                     "current build does not point to dir in deploy path: {}".format(
-                        build
+                        link
                     )
                 )
+            links[entry.name] = target.name
+    return links
+
+
+def ref_link_name(git_ref: str, remote: str = DEFAULT_REMOTE) -> str:
+    """
+    The name of the per-ref link of a Git ref: `current-` followed by the
+    normalized branch or tag name, so that a branch and its remote-tracking
+    branch (such as `origin/feature`) share a link.
+    """
+    for prefix in ("refs/heads/", "refs/tags/", "refs/remotes/%s/" % remote):
+        if git_ref.startswith(prefix):
+            git_ref = git_ref[len(prefix) :]
+            break
+    else:
+        if git_ref.startswith(remote + "/"):
+            git_ref = git_ref[len(remote) + 1 :]
+
+    # laika.git imports this module
+    from .git import normalize_refname
+
+    return CURRENT_LINK + "-" + normalize_refname(git_ref)
 
-            return target.name
-        elif build.exists():
-            raise RuntimeError(
-                "current build must be symlink to sibling directory: {}".format(build)
-            )
-        else:
-            return None
 
-    current_build_name = resolve_current_build(deploy_path / "current")
+def current_link_name(build: Build, per_ref: bool, remote: str = DEFAULT_REMOTE) -> str:
+    """
+    The name of the link through which a build is deployed: `current`, or
+    the link of its ref (see `ref_link_name`) when each ref has its own link.
+    """
+    if not per_ref:
+        return CURRENT_LINK
+    if not isinstance(build.meta, BuildMeta):
+        raise RuntimeError("build has no Git ref: {}".format(build.build_id))
+
+    return ref_link_name(build.meta.git_ref, remote)
+
+
+def list_builds(deploy_path: Path, allow_invalid=True) -> Builds:
+    entries = build_index(deploy_path).entries()
+    links = current_links(deploy_path)
 
     def _accept_build(build: Build) -> bool:
         return allow_invalid or not build.is_metadata_missing()
 
-    builds = filter(_accept_build, map(get_build, build_paths))
-    return Builds(list(builds), current_build_name)
+    builds = (
+        _build_from_index_entry(deploy_path / build_id, entry)
+        for build_id, entry in sorted(entries.items())
+    )
+    return Builds(list(filter(_accept_build, builds)), links)
 
 
 def post_deploy(build: Build, config: Config, reporter: Reporter):
@@ -267,25 +954,46 @@ def post_deploy(build: Build, config: Config, reporter: Reporter):
     if not command:
         return
 
-    run_command_on_build(command, build, config, reporter)
+    run_command_on_build(
+        command, build, config, reporter, limits=config.resource_limits("post_deploy")
+    )
 
 
 def deploy_prepared_build(build: Build, config: Config, reporter: Reporter):
     deploy_id = build.build_id
     root = config.deploy_root
 
-    current = root / "current"
-    current_new = root / "current.new"
+    link_name = current_link_name(
+        build, config.link_per_ref, config.fetch_settings.remote or DEFAULT_REMOTE
+    )
+    current = root / link_name
+    current_new = root / (link_name + ".new")
 
     deploy_target = root / deploy_id
-    if not deploy_target.is_dir():
-        raise RuntimeError("build must exist: {}".format(deploy_target))
 
-    reporter.info("Linking new version (%s)" % deploy_id)
-    os.symlink(deploy_id, current_new)
-    os.replace(current_new, current)
+    timer = PhaseTimer()
+
+    reporter.info("Linking new version (%s) as %s" % (deploy_id, link_name))
+    with timer.phase("activate"), build_index(root).updating():
+        # Checked while the deploy root is locked, so that the build cannot
+        # be purged before it is linked
+        if not deploy_target.is_dir():
+            raise RuntimeError("build must exist: {}".format(deploy_target))
+
+        # Left behind by an interrupted deployment
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(current_new)
+        os.symlink(deploy_id, current_new)
+        os.replace(current_new, current)
     reporter.success("Activated deployment %s" % deploy_id)
 
-    post_deploy(build, config, reporter)
+    try:
+        with timer.phase("post_deploy"):
+            post_deploy(build, config, reporter)
+    finally:
+        if isinstance(build.meta, BuildMeta):
+            build.meta.timings.update(timer.timings)
+            save_build_meta(build)
 
     reporter.success("Deployed %s" % deploy_id)
+    reporter.output("deployed", None, build_id=deploy_id, link=link_name)
@@ -0,0 +1,188 @@
+import contextlib
+import hashlib
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+from .core import Build, BuildMeta, BuildMetaFile, BuildStatus, save_build_meta
+from .fs import allocated_size
+from .index import build_lock_path
+from .lock import try_shared_lock
+from .logs import LOG_FILE
+from .output import Reporter
+
+
+class DedupeResult(NamedTuple):
+    files_linked: int
+    bytes_reclaimed: int
+
+
+class _File(NamedTuple):
+    build: Build
+    path: str
+    stat: os.stat_result
+    replaceable: bool
+
+
+def _is_laika_file(name: str) -> bool:
+    return name == BuildMetaFile._PATH or name.startswith(LOG_FILE)
+
+
+def _regular_files(build_dir: Path) -> Iterable[Tuple[str, os.stat_result]]:
+    pending = [str(build_dir)]
+    while pending:
+        directory = pending.pop()
+        try:
+            it = os.scandir(directory)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with it:
+            for entry in it:
+                if directory == str(build_dir) and (
+                    entry.name == ".git" or _is_laika_file(entry.name)
+                ):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        yield entry.path, entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_in_place(source: str, target: str):
+    """Atomically replace `target` with a hard link to `source`."""
+    temporary = "%s.laika-dedupe" % target
+    os.link(source, temporary)
+    try:
+        os.replace(temporary, target)
+    except OSError:
+        os.unlink(temporary)
+        raise
+
+
+def dedupe_builds(
+    builds: Iterable[Build],
+    protected: Set[str],
+    reporter: Reporter,
+    dry_run: bool = False,
+    jobs: int = 1,
+) -> DedupeResult:
+    """
+    Replace identical files across builds with hard links to a single copy.
+    Files must have the same size, contents, permissions and owner to be
+    linked. Builds still being built are left alone, and builds whose IDs
+    are in `protected` (such as the current one) are never modified, though
+    their files can be linked to from other builds.
+
+    Builds are marked as in use while their files are linked, so that they
+    are not purged meanwhile; builds being purged are skipped.
+    """
+    with contextlib.ExitStack() as locks:
+        in_use = []
+        for build in builds:
+            if not isinstance(build.meta, BuildMeta):
+                continue
+            if build.meta.status == BuildStatus.pending:
+                continue
+
+            lock_fd = try_shared_lock(
+                build_lock_path(build.path.parent, build.build_id)
+            )
+            if lock_fd is None:
+                reporter.info("Skipping %s: it is being removed" % build.build_id)
+                continue
+            locks.callback(os.close, lock_fd)
+            # It may have been purged before it was locked
+            if build.path.is_dir():
+                in_use.append(build)
+
+        result = _dedupe_builds(in_use, protected, reporter, dry_run, jobs)
+
+    return result
+
+
+def _dedupe_builds(
+    builds: List[Build],
+    protected: Set[str],
+    reporter: Reporter,
+    dry_run: bool,
+    jobs: int,
+) -> DedupeResult:
+    by_key: Dict[tuple, List[_File]] = defaultdict(list)
+    for build in builds:
+        replaceable = build.build_id not in protected
+        for path, stat in _regular_files(build.path):
+            if stat.st_size == 0:
+                continue
+            key = (stat.st_dev, stat.st_size, stat.st_mode, stat.st_uid, stat.st_gid)
+            by_key[key].append(_File(build, path, stat, replaceable))
+
+    # Only files of the same size can be identical, so only those are read
+    candidates = [
+        files
+        for files in by_key.values()
+        if len({f.stat.st_ino for f in files}) > 1 and any(f.replaceable for f in files)
+    ]
+
+    def group_by_digest(files: List[_File]) -> List[List[_File]]:
+        by_digest: Dict[str, List[_File]] = defaultdict(list)
+        by_inode: Dict[int, str] = {}
+        for f in files:
+            if f.stat.st_ino not in by_inode:
+                by_inode[f.stat.st_ino] = _file_digest(f.path)
+            by_digest[by_inode[f.stat.st_ino]].append(f)
+        return [group for group in by_digest.values() if len(group) > 1]
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        groups = [
+            group
+            for groups in executor.map(group_by_digest, candidates)
+            for group in groups
+        ]
+
+    files_linked = 0
+    bytes_reclaimed = 0
+    linked_builds: Dict[str, Build] = {}
+    for group in groups:
+        # Keep the copy with the most links (preferring protected builds, as
+        # their files cannot be replaced anyway)
+        source = max(group, key=lambda f: (not f.replaceable, f.stat.st_nlink))
+        links_removed: Dict[int, int] = defaultdict(int)
+        for f in group:
+            if not f.replaceable or f.stat.st_ino == source.stat.st_ino:
+                continue
+            if not dry_run:
+                try:
+                    _link_in_place(source.path, f.path)
+                except OSError as e:
+                    reporter.error("Failed to link %s: %s" % (f.path, e))
+                    continue
+            files_linked += 1
+            linked_builds[source.build.build_id] = source.build
+            linked_builds[f.build.build_id] = f.build
+            links_removed[f.stat.st_ino] += 1
+            # The space is only freed when the last link to a copy is gone
+            if links_removed[f.stat.st_ino] == f.stat.st_nlink:
+                bytes_reclaimed += allocated_size(f.stat)
+
+    if not dry_run:
+        # Their files are now shared, so their recorded sizes no longer tell
+        # how much space would be freed by removing them
+        for build in linked_builds.values():
+            if isinstance(build.meta, BuildMeta) and build.meta.size is not None:
+                build.meta.size = None
+                save_build_meta(build)
+
+    return DedupeResult(files_linked, bytes_reclaimed)
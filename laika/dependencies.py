@@ -0,0 +1,82 @@
+import filecmp
+from pathlib import Path
+from typing import Iterable, Optional
+
+from laika.core import (
+    Build,
+    BuildStatus,
+    Config,
+    DependencyCacheSpec,
+    BuildMeta,
+    save_build_meta,
+)
+from laika.fs import copy_tree
+from laika.output import Reporter
+
+
+def _same_key_files(spec: DependencyCacheSpec, a: Path, b: Path) -> bool:
+    for key_file in spec.key_files:
+        file_a, file_b = a / key_file, b / key_file
+        if not (file_a.is_file() and file_b.is_file()):
+            return False
+        if not filecmp.cmp(str(file_a), str(file_b), shallow=False):
+            return False
+
+    return True
+
+
+def find_dependency_source(
+    spec: DependencyCacheSpec, build: Build, candidates: Iterable[Build]
+) -> Optional[Build]:
+    """
+    Find the most recent successful build that has the cached path and whose
+    key files are identical to the ones in the given build.
+    """
+    for candidate in sorted(candidates, key=lambda b: b.build_id, reverse=True):
+        if candidate.build_id == build.build_id:
+            continue
+        if not isinstance(candidate.meta, BuildMeta):
+            continue
+        if candidate.meta.status != BuildStatus.succeeded:
+            continue
+        if not (candidate.path / spec.path).is_dir():
+            continue
+        if _same_key_files(spec, build.path, candidate.path):
+            return candidate
+
+    return None
+
+
+def seed_dependencies(
+    build: Build, candidates: Iterable[Build], config: Config, reporter: Reporter
+):
+    """
+    Populate the dependency directories of a freshly checked out build from
+    a previous compatible build, so that the build command finds them
+    already installed.
+    """
+    candidates = list(candidates)
+    for spec in config.dependency_caches:
+        target = build.path / spec.path
+        if target.exists():
+            reporter.info("Not reusing %s: already present in the build" % spec.path)
+            continue
+
+        source = find_dependency_source(spec, build, candidates)
+        if source is None:
+            reporter.info("No previous build to reuse %s from" % spec.path)
+            continue
+
+        reporter.info(
+            "Reusing %s from build %s (%s)" % (spec.path, source.build_id, spec.method)
+        )
+        target.parent.mkdir(parents=True, exist_ok=True)
+        copy_tree(source.path / spec.path, target, method=spec.method)
+        if (
+            spec.method == "hardlink"
+            and isinstance(source.meta, BuildMeta)
+            and source.meta.size is not None
+        ):
+            # Its files are now shared with the new build
+            source.meta.size = None
+            save_build_meta(source)
@@ -0,0 +1,143 @@
+import errno
+import fnmatch
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+LINK_METHODS = ("hardlink", "reflink", "copy")
+
+# From <linux/fs.h>; clones the file extents on filesystems supporting it
+# (e.g. Btrfs, XFS)
+_FICLONE = 0x40049409
+
+
+def _copy_file(src, dst):
+    return shutil.copy2(src, dst)
+
+
+def _hardlink_file(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        return _copy_file(src, dst)
+    return dst
+
+
+def _reflink_file(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        return _copy_file(src, dst)
+
+    with open(src, "rb") as src_stream, open(dst, "wb") as dst_stream:
+        try:
+            fcntl.ioctl(dst_stream.fileno(), _FICLONE, src_stream.fileno())
+        except OSError:
+            cloned = False
+        else:
+            cloned = True
+
+    if not cloned:
+        return _copy_file(src, dst)
+
+    shutil.copystat(src, dst)
+    return dst
+
+
+_COPY_FUNCTIONS = {
+    "hardlink": _hardlink_file,
+    "reflink": _reflink_file,
+    "copy": _copy_file,
+}
+
+
+def copy_tree(src: Path, dst: Path, method: str = "copy", exclude: Sequence[str] = ()):
+    """
+    Recursively copy a directory tree, except for the entries at its top
+    level matching the glob patterns in `exclude`. With the `hardlink` and
+    `reflink` methods, file contents are shared with the source tree when
+    the filesystem allows it, falling back to regular copies otherwise.
+    """
+    if method not in _COPY_FUNCTIONS:
+        raise ValueError("invalid copy method: %r" % method)
+
+    def ignore(directory, names):
+        if directory != str(src):
+            return []
+        return [
+            name
+            for name in names
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude)
+        ]
+
+    shutil.copytree(
+        str(src),
+        str(dst),
+        symlinks=True,
+        copy_function=_COPY_FUNCTIONS[method],
+        ignore=ignore,
+    )
+
+
+def disk_usage(path: Path) -> int:
+    """
+    Compute the disk space used by a directory tree, counting files with
+    several hard links in the tree only once.
+    """
+    unshared, shared = shared_disk_usage(path)
+    return unshared + sum(shared.values())
+
+
+def shared_disk_usage(path: Path) -> Tuple[int, Dict[Tuple[int, int], int]]:
+    """
+    Compute the disk space used by a directory tree, as the space used by
+    the entries with a single hard link, and the space used by each file
+    with several hard links (which may be shared with other trees), by
+    device and inode number.
+    """
+    shared: Dict[Tuple[int, int], int] = {}
+    total = 0
+    pending = [str(path)]
+    while pending:
+        try:
+            it = os.scandir(pending.pop())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with it:
+            for entry in it:
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+
+                if entry.is_dir(follow_symlinks=False):
+                    total += allocated_size(stat)
+                    pending.append(entry.path)
+                elif stat.st_nlink > 1:
+                    shared[(stat.st_dev, stat.st_ino)] = allocated_size(stat)
+                else:
+                    total += allocated_size(stat)
+    return total, shared
+
+
+def allocated_size(stat: os.stat_result) -> int:
+    """The disk space used by a file, given its stat result."""
+    blocks = getattr(stat, "st_blocks", None)
+    if blocks is None:
+        return stat.st_size
+    return blocks * 512
+
+
+def copy_path(src: Path, dst: Path, method: str = "copy"):
+    """Copy a file or a directory tree, as in `copy_tree`."""
+    if src.is_dir() and not src.is_symlink():
+        copy_tree(src, dst, method=method)
+    elif src.is_symlink():
+        os.symlink(os.readlink(str(src)), str(dst))
+    else:
+        if method not in _COPY_FUNCTIONS:
+            raise ValueError("invalid copy method: %r" % method)
+        _COPY_FUNCTIONS[method](str(src), str(dst))
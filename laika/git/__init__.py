@@ -1,5 +1,8 @@
+import contextlib
 import re
 import subprocess
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
 
 from laika.core import build_command_line
 
@@ -8,30 +11,133 @@ class GitRevisionParseFail(RuntimeError):
     pass
 
 
+_tracers: List[Callable[[List[str], float], None]] = []
+
+
+def add_tracer(tracer: Callable[[List[str], float], None]):
+    """
+    Register a function to be called with the command line and the elapsed
+    time (in seconds) of every Git command run through `run_git`.
+    """
+    _tracers.append(tracer)
+
+
+@contextlib.contextmanager
+def traced(cmd: Sequence[str]):
+    """Report the time taken by the block running `cmd` to the tracers."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for tracer in _tracers:
+            tracer(list(cmd), elapsed)
+
+
+def run_git(args: List[str], gitdir=None, **kwargs) -> subprocess.CompletedProcess:
+    cmd = ["git"] + args
+    with traced(cmd):
+        return subprocess.run(cmd, cwd=gitdir, **kwargs)
+
+
+def _is_bad_revision(error: subprocess.CalledProcessError) -> bool:
+    stderr = (error.stderr or "").strip()
+    return stderr == "fatal: Needed a single revision" or stderr.startswith(
+        "fatal: bad revision"
+    )
+
+
 def git_rev_parse_short(ref, gitdir=None):
     return git_rev_parse(ref, short=True, gitdir=gitdir)
 
 
 def git_rev_parse(ref, short=False, gitdir=None):
     cmd = build_command_line(
-        [
-            "git",
-            "rev-parse",
-            "--verify",
-            "--short" if short else None,
-            ref + "^{commit}",
-        ]
+        ["rev-parse", "--verify", "--short" if short else None, ref + "^{commit}",]
     )
 
     try:
-        return subprocess.check_output(
-            cmd, stderr=subprocess.PIPE, cwd=gitdir, encoding="utf-8"
-        ).strip()
+        return run_git(
+            cmd,
+            gitdir=gitdir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+            check=True,
+        ).stdout.strip()
     except subprocess.CalledProcessError as e:
-        if e.stderr.strip() == "fatal: Needed a single revision":
+        if _is_bad_revision(e):
             raise GitRevisionParseFail()
         raise
 
 
+def resolve_commit(ref, gitdir=None) -> Tuple[str, str]:
+    """
+    Resolve a ref to a commit, returning both its full and abbreviated
+    hashes with a single Git command.
+    """
+    commit = ref + "^{commit}"
+    try:
+        output = run_git(
+            ["rev-parse", commit, "--short", commit, "--"],
+            gitdir=gitdir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+            check=True,
+        ).stdout
+    except subprocess.CalledProcessError as e:
+        if _is_bad_revision(e):
+            raise GitRevisionParseFail()
+        raise
+
+    full_hash, short_hash = output.split()
+    return full_hash, short_hash
+
+
 def normalize_refname(refname):
     return re.sub(r"[^a-zA-Z0-9_-]", "--", refname)
+
+
+class BatchCommitResolver:
+    """
+    Resolves many refs to commit hashes through a single, long-lived
+    `git cat-file --batch-check` process. Use as a context manager.
+    """
+
+    def __init__(self, gitdir=None) -> None:
+        self.gitdir = gitdir
+        self._cmd = ["git", "cat-file", "--batch-check=%(objectname) %(objecttype)"]
+        self._proc: Optional[subprocess.Popen] = None
+
+    def __enter__(self):
+        self._proc = subprocess.Popen(
+            self._cmd,
+            cwd=self.gitdir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            encoding="utf-8",
+        )
+        return self
+
+    def __exit__(self, *exc_details):
+        assert self._proc is not None and self._proc.stdin is not None
+        self._proc.stdin.close()
+        self._proc.wait()
+        self._proc = None
+
+    def resolve(self, ref: str) -> Optional[str]:
+        """Return the full hash of the commit `ref` points to, if any."""
+        proc = self._proc
+        assert proc is not None and proc.stdin is not None and proc.stdout is not None
+        if "\n" in ref:
+            return None
+
+        with traced(self._cmd + ["<<<", ref]):
+            proc.stdin.write(ref + "^{commit}\n")
+            proc.stdin.flush()
+            fields = proc.stdout.readline().split()
+
+        if len(fields) == 2 and fields[1] == "commit":
+            return fields[0]
+        return None
@@ -0,0 +1,161 @@
+import contextlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import ContextManager, Dict, Optional, Tuple
+
+from .lock import exclusive_lock
+
+# Directory under the deploy root where laika keeps its own state
+STATE_DIR = ".laika"
+
+# Held while changing the deploy root; see `deploy_root_lock`
+LOCK_FILE = "lock"
+
+# Directory under STATE_DIR with the lock file of each build
+BUILD_LOCKS_DIR = "builds"
+
+Entries = Dict[str, Optional[dict]]
+
+_SCAN_THREADS = 8
+
+
+class BuildIndex:
+    """
+    A cache of the metadata of all builds in a deploy root, kept in a single
+    file so that listing builds does not require visiting every build
+    directory.
+
+    The index is only trusted while the deploy root directory has not been
+    changed since the index was written; otherwise the deploy root is
+    scanned again. Changes that laika itself makes to the deploy root should
+    be done inside `updating()` so that the index stays valid, and so that
+    they do not interfere with other laika processes.
+    """
+
+    _FILE = "index.json"
+    _VERSION = 1
+
+    def __init__(self, deploy_root: Path, meta_file_name: str):
+        self.deploy_root = deploy_root
+        self.meta_file_name = meta_file_name
+
+    @property
+    def path(self) -> Path:
+        return self.deploy_root / STATE_DIR / self._FILE
+
+    def _signature(self) -> Tuple[int, int]:
+        stat = os.stat(self.deploy_root)
+        return stat.st_mtime_ns, stat.st_nlink
+
+    def read(self) -> Optional[Entries]:
+        """Return the indexed entries, or None if the index is missing or stale."""
+        try:
+            with self.path.open() as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("version") != self._VERSION:
+            return None
+        if tuple(data.get("signature", ())) != self._signature():
+            return None
+
+        return data["builds"]
+
+    def scan(self) -> Entries:
+        # Only needed when scanning, which most commands do not do
+        from concurrent.futures import ThreadPoolExecutor
+
+        with os.scandir(self.deploy_root) as it:
+            names = [
+                entry.name
+                for entry in it
+                if not entry.name.startswith(".")
+                and not entry.is_symlink()
+                and entry.is_dir()
+            ]
+
+        # Reading many small files is mostly waiting on I/O
+        with ThreadPoolExecutor(max_workers=_SCAN_THREADS) as executor:
+            metas = executor.map(self._read_meta, names, chunksize=64)
+            return dict(zip(names, metas))
+
+    def _read_meta(self, name: str) -> Optional[dict]:
+        path = os.path.join(self.deploy_root, name, self.meta_file_name)
+        try:
+            with open(path) as stream:
+                return json.load(stream)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, entries: Entries, signature: Tuple[int, int]):
+        state_dir = self.path.parent
+        data = dict(version=self._VERSION, signature=list(signature), builds=entries)
+
+        fd, tmp_path = tempfile.mkstemp(dir=str(state_dir), prefix=".index.")
+        try:
+            with os.fdopen(fd, "w") as stream:
+                json.dump(data, stream)
+            os.replace(tmp_path, str(self.path))
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+
+    def _save(self, entries: Entries, signature: Optional[Tuple[int, int]] = None):
+        # The index is only a cache; failing to write it (e.g. when the deploy
+        # root is read-only for the current user) must not be fatal.
+        with contextlib.suppress(OSError):
+            # Creating the state directory changes the deploy root, so it must
+            # happen before its signature is taken
+            self.path.parent.mkdir(exist_ok=True)
+            if signature is None:
+                signature = self._signature()
+            self._write(entries, signature)
+
+    def rebuild(self) -> Entries:
+        with contextlib.suppress(OSError):
+            self.path.parent.mkdir(exist_ok=True)
+
+        # Changes made while scanning will make the index stale
+        signature = self._signature()
+        entries = self.scan()
+        self._save(entries, signature)
+        return entries
+
+    def entries(self) -> Entries:
+        entries = self.read()
+        if entries is None:
+            entries = self.rebuild()
+        return entries
+
+    @contextlib.contextmanager
+    def updating(self):
+        """
+        Context manager for changes to the deploy root. It yields the current
+        entries, which the caller should update to reflect the changes made
+        inside the block; the index is then saved as valid for the new state
+        of the deploy root. The deploy root is locked for the whole block.
+        """
+        with deploy_root_lock(self.deploy_root):
+            entries = self.entries()
+            yield entries
+            self._save(entries)
+
+
+def deploy_root_lock(deploy_root: Path) -> ContextManager[None]:
+    """
+    Lock held while changing the deploy root (such as when adding, removing
+    or selecting builds), so that concurrent laika processes take turns.
+    """
+    state_dir = deploy_root / STATE_DIR
+    state_dir.mkdir(exist_ok=True)
+    return exclusive_lock(state_dir / LOCK_FILE)
+
+
+def build_lock_path(deploy_root: Path, build_id: str) -> Path:
+    locks_dir = deploy_root / STATE_DIR / BUILD_LOCKS_DIR
+    locks_dir.mkdir(parents=True, exist_ok=True)
+    return locks_dir / (build_id + ".lock")
@@ -0,0 +1,122 @@
+import contextlib
+import datetime
+import fcntl
+import os
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+# How often to retry taking a lock while waiting with a timeout
+_POLL_INTERVAL = 0.1
+
+# Applies to all locks taken without an explicit timeout; see `set_default_timeout`
+_default_timeout: Optional[float] = None
+
+
+class LockTimeout(RuntimeError):
+    pass
+
+
+def set_default_timeout(timeout: Optional[float]):
+    """
+    Give up taking a lock after `timeout` seconds, or wait indefinitely if
+    `timeout` is None.
+    """
+    global _default_timeout
+    _default_timeout = timeout
+
+
+def _describe_holder(path: Path) -> str:
+    try:
+        holder = path.read_text().split()
+    except OSError:
+        holder = []
+
+    if len(holder) != 3:
+        return ""
+    pid, host, since = holder
+    return " (held by PID %s on %s since %s)" % (pid, host, since)
+
+
+def _flock(fd: int, operation: int, path: Path, timeout: Optional[float]):
+    if timeout is None:
+        timeout = _default_timeout
+    if timeout is None:
+        fcntl.flock(fd, operation)
+        return
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                raise LockTimeout(
+                    "Timed out waiting for lock %s%s" % (path, _describe_holder(path))
+                )
+            time.sleep(_POLL_INTERVAL)
+
+
+@contextlib.contextmanager
+def exclusive_lock(path: Path, timeout: Optional[float] = None) -> Iterator[None]:
+    """
+    Hold an exclusive lock on a file, which is created if needed, waiting up
+    to `timeout` seconds for other processes (or threads) to release it.
+
+    Locks are released by the operating system when their holder exits, so a
+    crashed process never leaves a stale lock behind. The PID and host of the
+    holder are written to the file only to tell who is keeping others waiting.
+    """
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        _flock(fd, fcntl.LOCK_EX, path, timeout)
+        since = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        os.ftruncate(fd, 0)
+        os.write(
+            fd, ("%d %s %s\n" % (os.getpid(), os.uname().nodename, since)).encode()
+        )
+        yield
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def shared_lock(path: Path, timeout: Optional[float] = None) -> Iterator[None]:
+    """Hold a shared lock on a file, as in `exclusive_lock`."""
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        _flock(fd, fcntl.LOCK_SH, path, timeout)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _try_lock(path: Path, operation: int) -> Optional[int]:
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def try_exclusive_lock(path: Path) -> Optional[int]:
+    """
+    Take an exclusive lock on a file without waiting, returning the file
+    descriptor that holds it (to be closed to release the lock), or None if
+    the lock is held by someone else.
+    """
+    return _try_lock(path, fcntl.LOCK_EX)
+
+
+def try_shared_lock(path: Path) -> Optional[int]:
+    """
+    Take a shared lock on a file without waiting, as in `try_exclusive_lock`,
+    returning None if someone holds an exclusive lock on it.
+    """
+    return _try_lock(path, fcntl.LOCK_SH)
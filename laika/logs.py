@@ -0,0 +1,222 @@
+import datetime
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import IO, Iterator, List, Optional, Sequence
+
+from .process import ProcessGroups, terminate_process_group
+
+LOG_FILE = "_build.log"
+
+# Lines longer than this are split, so that memory use stays bounded
+_MAX_CHUNK = 64 * 1024
+
+# Keeps lines from concurrent commands from being interleaved
+_output_lock = threading.Lock()
+
+
+class BuildLog:
+    """
+    Writes the output of the commands run on a build to a log file in the
+    build directory, with a timestamp on each line. When the file grows
+    beyond `max_size` bytes it is rotated, keeping up to `backups` older
+    files (optionally compressed).
+    """
+
+    def __init__(
+        self, build_dir: Path, max_size: int, backups: int, compress: bool = False
+    ):
+        self.path = build_dir / LOG_FILE
+        self.max_size = max_size
+        self.backups = backups
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._stream: Optional[IO[bytes]] = None
+
+    def __enter__(self):
+        self._stream = self.path.open("ab")
+        return self
+
+    def __exit__(self, *exc_details):
+        self.close()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def write_line(self, line: bytes):
+        timestamp = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        if not line.endswith(b"\n"):
+            line += b"\n"
+
+        with self._lock:
+            assert self._stream is not None
+            self._stream.write(timestamp.encode("ascii") + b" " + line)
+            self._stream.flush()
+            if self._stream.tell() >= self.max_size:
+                self._rotate()
+
+    def write_message(self, message: str):
+        self.write_line(("--- %s" % message).encode("utf-8"))
+
+    def _backup_path(self, number: int) -> Path:
+        suffix = ".%d.gz" % number if self.compress else ".%d" % number
+        return self.path.with_name(self.path.name + suffix)
+
+    def _rotate(self):
+        assert self._stream is not None
+        self._stream.close()
+
+        if self.backups > 0:
+            for number in range(self.backups - 1, 0, -1):
+                if self._backup_path(number).exists():
+                    os.replace(self._backup_path(number), self._backup_path(number + 1))
+
+            if self.compress:
+                with self.path.open("rb") as src, gzip.open(
+                    str(self._backup_path(1)), "wb"
+                ) as dst:
+                    shutil.copyfileobj(src, dst)
+                self.path.unlink()
+            else:
+                os.replace(self.path, self._backup_path(1))
+        else:
+            self.path.unlink()
+
+        self._stream = self.path.open("ab")
+
+
+def stream_command(
+    cmd: Sequence[str],
+    output: Optional[IO[str]],
+    log: BuildLog,
+    prefix: str = "",
+    timeout: Optional[float] = None,
+    groups: Optional[ProcessGroups] = None,
+    **kwargs
+) -> int:
+    """
+    Run a command, copying its output (both standard output and error) line
+    by line to `output` (the standard output by default) and to the build
+    log. Returns the exit status of the command.
+
+    The command runs in its own process group, which is terminated if the
+    command takes longer than `timeout` seconds (raising TimeoutExpired) or
+    if laika is interrupted. If `groups` is given, the process group is
+    added to it while the command runs.
+    """
+    if output is None:
+        output = sys.stdout
+
+    timed_out = threading.Event()
+
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+        **kwargs
+    ) as proc:
+        if groups is not None:
+            groups.add(proc)
+
+        def expire():
+            timed_out.set()
+            terminate_process_group(proc)
+
+        timer = threading.Timer(timeout, expire) if timeout is not None else None
+        if timer is not None:
+            timer.start()
+
+        try:
+            assert proc.stdout is not None
+            for line in iter(lambda: proc.stdout.readline(_MAX_CHUNK), b""):  # type: ignore
+                log.write_line(prefix.encode("utf-8") + line)
+                with _output_lock:
+                    output.write(prefix + line.decode("utf-8", errors="replace"))
+                    output.flush()
+        except KeyboardInterrupt:
+            terminate_process_group(proc)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+                timer.join()
+            if groups is not None:
+                groups.discard(proc)
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)  # type: ignore
+
+    return proc.returncode
+
+
+def _backup_paths(build_dir: Path) -> List[Path]:
+    """Rotated log files of a build, from the oldest to the newest."""
+    numbered = []
+    for path in build_dir.glob(LOG_FILE + ".*"):
+        number = path.name[len(LOG_FILE) + 1 :].split(".")[0]
+        if number.isdigit():
+            numbered.append((int(number), path))
+    return [path for _, path in sorted(numbered, reverse=True)]
+
+
+def _read_chunks(stream) -> Iterator[bytes]:
+    return iter(lambda: stream.read(_MAX_CHUNK), b"")
+
+
+def read_log(build_dir: Path, include_current: bool = True) -> Iterator[bytes]:
+    """Yield the contents of the log of a build, from the oldest rotated file."""
+    for backup in _backup_paths(build_dir):
+        if backup.suffix == ".gz":
+            with gzip.open(str(backup), "rb") as stream:
+                yield from _read_chunks(stream)
+        else:
+            with open(str(backup), "rb") as stream:
+                yield from _read_chunks(stream)
+
+    path = build_dir / LOG_FILE
+    if include_current and path.exists():
+        with path.open("rb") as stream:
+            yield from _read_chunks(stream)
+
+
+def follow_log(build_dir: Path, poll_interval: float = 0.5) -> Iterator[bytes]:
+    """
+    Yield the contents of the current log file of a build and then any data
+    appended to it, following rotations, until interrupted.
+    """
+    path = build_dir / LOG_FILE
+    stream: Optional[IO[bytes]] = None
+    inode = None
+    try:
+        while True:
+            try:
+                current_inode: Optional[int] = os.stat(path).st_ino
+            except FileNotFoundError:
+                current_inode = None
+
+            if current_inode != inode:
+                # The log was created or rotated; finish reading the old file
+                if stream is not None:
+                    yield from _read_chunks(stream)
+                    stream.close()
+                    stream = None
+                if current_inode is not None:
+                    stream = path.open("rb")
+                inode = current_inode
+
+            data = stream.read(_MAX_CHUNK) if stream is not None else b""
+            if data:
+                yield data
+            else:
+                time.sleep(poll_interval)
+    finally:
+        if stream is not None:
+            stream.close()
@@ -1,7 +1,14 @@
+import json
 import sys
+import threading
+from typing import Optional
 
 from .term_color import formatted_span
 
+# Events are reported from several threads at once, and each must be written
+# as a single line
+_emit_lock = threading.Lock()
+
 
 def null_formatter(color):
     def format_message(message):
@@ -11,9 +18,15 @@ def null_formatter(color):
 
 
 class Reporter:
-    def __init__(self, color=True, quiet=False):
+    def __init__(self, color=True, quiet=False, verbose=False):
         self.color = formatted_span if color else null_formatter
         self.quiet = quiet
+        self.verbose = verbose
+
+    @property
+    def subprocess_stdout(self):
+        """Where the standard output of commands run by laika should go."""
+        return None
 
     def success(self, message):
         if self.quiet:
@@ -27,3 +40,60 @@ class Reporter:
 
     def error(self, message):
         print(self.color("red")("ERROR: %s" % message), file=sys.stderr)
+
+    def debug(self, message):
+        if self.quiet or not self.verbose:
+            return
+        print(self.color("cyan")("· %s" % message), file=sys.stderr)
+
+    def output(self, event: Optional[str], text: Optional[str], **data):
+        """
+        Report a result of a command. `text` is what is shown to humans, if
+        anything, and `data` holds the same information in structured form
+        as an `event`; text-only output (such as table headers) has no event.
+        """
+        if text is not None:
+            print(text)
+
+
+class JsonReporter(Reporter):
+    """
+    Reports everything as a stream of JSON objects on the standard output,
+    one per line, each with an `event` field.
+    """
+
+    def __init__(self, quiet=False, verbose=False):
+        super().__init__(color=False, quiet=quiet, verbose=verbose)
+
+    @property
+    def subprocess_stdout(self):
+        # Keep the standard output for events only
+        return sys.stderr
+
+    def _emit(self, event: str, **data):
+        line = json.dumps(dict(event=event, **data), default=str)
+        with _emit_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def success(self, message):
+        if self.quiet:
+            return
+        self._emit("success", message=message)
+
+    def info(self, message):
+        if self.quiet:
+            return
+        self._emit("info", message=message)
+
+    def error(self, message):
+        self._emit("error", message=message)
+
+    def debug(self, message):
+        if self.quiet or not self.verbose:
+            return
+        self._emit("debug", message=message)
+
+    def output(self, event: Optional[str], text: Optional[str], **data):
+        if event is not None:
+            self._emit(event, **data)
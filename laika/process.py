@@ -0,0 +1,130 @@
+import os
+import shutil
+import signal
+import subprocess
+import threading
+from typing import List, NamedTuple, Optional, Sequence, Set
+
+
+def ionice_prefix(io_class: str = "idle") -> List[str]:
+    """
+    Command prefix to run a command with the given I/O scheduling class,
+    if the `ionice` utility is available.
+    """
+    ionice = shutil.which("ionice")
+    if ionice is None:
+        return []
+
+    classes = {"realtime": "1", "best-effort": "2", "idle": "3"}
+    return [ionice, "-c", classes[io_class]]
+
+
+def spawn_detached(args: Sequence[str], log_path: str, niceness: int = 19):
+    """
+    Start a command in the background, in a new session so that it is not
+    affected by the terminal of the current process, with low CPU and I/O
+    priority.
+    """
+    with open(log_path, "ab") as log:
+        return subprocess.Popen(
+            ["nice", "-n", str(niceness)] + ionice_prefix() + list(args),
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+            close_fds=True,
+        )
+
+
+class ResourceLimits(NamedTuple):
+    """Limits on the time and resources used by a command and its children."""
+
+    timeout: Optional[float] = None
+    cpu_limit: Optional[int] = None
+    memory_limit: Optional[int] = None
+    nice: Optional[int] = None
+    ionice: Optional[str] = None
+
+
+IONICE_CLASSES = ("realtime", "best-effort", "idle")
+
+
+def limited_command(args: Sequence[str], limits: ResourceLimits) -> List[str]:
+    """
+    Prefix a command so that it runs with the CPU time and memory limits,
+    niceness and I/O priority in `limits`.
+
+    The limits are set by the commands in the prefix rather than by Python
+    code run in the child process (`preexec_fn`), which is unsafe when
+    commands are started from several threads.
+    """
+    prefix: List[str] = []
+    if limits.ionice is not None:
+        prefix += ionice_prefix(limits.ionice)
+    if limits.nice:
+        prefix += ["nice", "-n", str(limits.nice)]
+
+    ulimits = []
+    if limits.cpu_limit is not None:
+        ulimits.append("ulimit -t %d" % limits.cpu_limit)
+    if limits.memory_limit is not None:
+        # In kilobytes; the limit is on the address space (RLIMIT_AS)
+        ulimits.append("ulimit -v %d" % (limits.memory_limit // 1024))
+    if ulimits:
+        script = " && ".join(ulimits) + ' && exec "$@"'
+        prefix += ["/bin/sh", "-c", script, "sh"]
+
+    return prefix + list(args)
+
+
+def terminate_process_group(proc: subprocess.Popen, grace_period: float = 10.0):
+    """
+    Terminate a process started in its own session, along with every process
+    in its group, killing them if they are still running after the grace
+    period.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+
+    try:
+        proc.wait(grace_period)
+    except subprocess.TimeoutExpired:
+        pass
+
+    # Other processes in the group may outlive the main one
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class ProcessGroups:
+    """
+    The process groups of commands running concurrently, so that they can
+    all be terminated at once (e.g. when one of them fails).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._processes: Set[subprocess.Popen] = set()
+        self.terminated = False
+
+    def add(self, proc: subprocess.Popen):
+        with self._lock:
+            if not self.terminated:
+                self._processes.add(proc)
+                return
+        terminate_process_group(proc)
+
+    def discard(self, proc: subprocess.Popen):
+        with self._lock:
+            self._processes.discard(proc)
+
+    def terminate_all(self):
+        with self._lock:
+            self.terminated = True
+            processes = list(self._processes)
+        for proc in processes:
+            terminate_process_group(proc)
@@ -1,17 +1,50 @@
+import contextlib
 import datetime
-import subprocess
+import fnmatch
+import os
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
 
-from .core import Build, list_builds, BuildMeta
+from .artifacts import unused_entries
+from .core import (
+    Build,
+    BuildMeta,
+    BuildStatus,
+    build_index,
+    current_links,
+    list_builds,
+    save_build_meta,
+)
+from .fs import shared_disk_usage
+from .git import run_git
+from .index import build_lock_path, deploy_root_lock
+from .lock import try_exclusive_lock
 from .output import Reporter
+from .trash import move_to_trash, remove_tree, spawn_reaper
+from .units import format_size
 
 
 class PurgeSpecification(ABC):
-    @abstractmethod
+    """
+    A policy of which builds to keep. Builds not kept by the policy are
+    selected for removal.
+    """
+
     def filter(self, builds: Iterable[Build]) -> List[Build]:
-        pass
+        """The builds to be removed, latest first."""
+        latest_first = self.sort_latest_first(builds)
+        kept = {build.build_id for build in self.keep(latest_first)}
+        return [build for build in latest_first if build.build_id not in kept]
+
+    @abstractmethod
+    def keep(self, builds: List[Build]) -> List[Build]:
+        """
+        The builds to be kept, out of the given builds sorted latest first
+        (as by `sort_latest_first`), in the same order.
+        """
 
     @abstractmethod
     def describe(self) -> str:
@@ -25,19 +58,35 @@ class PurgeSpecification(ABC):
         return None, build.build_id
 
     @classmethod
-    def sort_latest_first(cls, builds: Iterable[Build]):
+    def sort_latest_first(cls, builds: Iterable[Build]) -> List[Build]:
         return sorted(builds, key=cls._build_meta_sort_key, reverse=True)
 
     @classmethod
     def keep_latest(cls, num_latest: int) -> "PurgeSpecification":
         return KeepLatestN(num_latest)
 
+    @classmethod
+    def keep_under_size(cls, max_size: int, jobs: int = 1) -> "PurgeSpecification":
+        return KeepUnderSize(max_size, jobs)
+
+    @classmethod
+    def keep_latest_per_ref(cls, pattern: str) -> "PurgeSpecification":
+        return KeepLatestPerRef(pattern)
+
     @classmethod
     def discard_older_than(
         cls, oldest_allowed_datetime: datetime.datetime
     ) -> "PurgeSpecification":
         return DiscardOlderThan(oldest_allowed_datetime)
 
+    @classmethod
+    def any_of(cls, *specs: "PurgeSpecification") -> "PurgeSpecification":
+        return KeepAnyOf(specs)
+
+    @classmethod
+    def all_of(cls, *specs: "PurgeSpecification") -> "PurgeSpecification":
+        return KeepAllOf(specs)
+
 
 class KeepLatestN(PurgeSpecification):
     def __init__(self, num_latest: int):
@@ -45,8 +94,8 @@ class KeepLatestN(PurgeSpecification):
             raise ValueError("num_latest must be a non-negative integer")
         self.num_latest = num_latest
 
-    def filter(self, builds):
-        return self.sort_latest_first(builds)[self.num_latest :]
+    def keep(self, builds):
+        return builds[: self.num_latest]
 
     def describe(self):
         return "Keeping %d latest deployments" % self.num_latest
@@ -58,12 +107,12 @@ class DiscardOlderThan(PurgeSpecification):
             raise TypeError("oldest_allowed_datetime must be a datetime.datetime")
         self.oldest_allowed_datetime = oldest_allowed_datetime
 
-    def filter(self, builds):
+    def keep(self, builds):
         return [
             build
-            for build in self.sort_latest_first(builds)
-            if build.is_metadata_missing()
-            or build.is_older_than(self.oldest_allowed_datetime)
+            for build in builds
+            if not build.is_metadata_missing()
+            and not build.is_older_than(self.oldest_allowed_datetime)
         ]
 
     def describe(self):
@@ -72,6 +121,136 @@ class DiscardOlderThan(PurgeSpecification):
         )
 
 
+class KeepUnderSize(PurgeSpecification):
+    """
+    Keep the latest deployments whose combined disk usage does not exceed
+    `max_size` bytes.
+    """
+
+    def __init__(self, max_size: int, jobs: int = 1):
+        if not isinstance(max_size, int) or max_size < 0:
+            raise ValueError("max_size must be a non-negative integer")
+        self.max_size = max_size
+        self.jobs = jobs
+
+    def keep(self, builds):
+        usages = build_usages(builds, jobs=self.jobs)
+
+        # Files hard-linked between builds (e.g. by `laika dedupe`) only take
+        # space once
+        seen_inodes = set()
+        total = 0
+        for i, build in enumerate(builds):
+            unshared, shared = usages[build.build_id]
+            total += unshared + sum(
+                size for inode, size in shared.items() if inode not in seen_inodes
+            )
+            seen_inodes.update(shared)
+            if total > self.max_size:
+                return builds[:i]
+        return builds
+
+    def describe(self):
+        return "Keeping latest deployments up to %s" % format_size(self.max_size)
+
+
+class KeepLatestPerRef(PurgeSpecification):
+    """
+    Keep the latest deployment of each Git ref matching a shell-style
+    pattern, such as `v*`.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+
+    def keep(self, builds):
+        seen_refs = set()
+        kept = []
+        for build in builds:
+            if not isinstance(build.meta, BuildMeta):
+                continue
+            ref = build.meta.git_ref
+            if ref in seen_refs or not fnmatch.fnmatchcase(ref, self.pattern):
+                continue
+            seen_refs.add(ref)
+            kept.append(build)
+        return kept
+
+    def describe(self):
+        return "Keeping the latest deployment of each ref matching %s" % self.pattern
+
+
+class KeepAnyOf(PurgeSpecification):
+    """Keep the deployments kept by any of the given specifications."""
+
+    def __init__(self, specs: Sequence[PurgeSpecification]):
+        self.specs = list(specs)
+
+    def keep(self, builds: List[Build]) -> List[Build]:
+        kept: Set[str] = set()
+        for spec in self.specs:
+            kept.update(build.build_id for build in spec.keep(builds))
+        return [build for build in builds if build.build_id in kept]
+
+    def describe(self):
+        return " or ".join("(%s)" % spec.describe() for spec in self.specs)
+
+
+class KeepAllOf(PurgeSpecification):
+    """
+    Keep the deployments kept by all of the given specifications, each one
+    being applied to the deployments kept by the previous ones (so that,
+    for instance, a size limit only counts deployments that would be kept).
+    """
+
+    def __init__(self, specs: Sequence[PurgeSpecification]):
+        self.specs = list(specs)
+
+    def keep(self, builds):
+        for spec in self.specs:
+            builds = spec.keep(builds)
+        return builds
+
+    def describe(self):
+        return " and ".join("(%s)" % spec.describe() for spec in self.specs)
+
+
+Usage = Tuple[int, Dict[Tuple[int, int], int]]
+
+
+def build_usages(builds: List[Build], jobs: int = 1) -> Dict[str, Usage]:
+    """
+    The disk usage of each build, as by `shared_disk_usage`. Builds with a
+    size recorded in their metadata have no files shared with other builds.
+    The usage of other builds is computed, up to `jobs` builds at a time,
+    and their size is set (but not saved) if they turn out to share no
+    files.
+    """
+    usages: Dict[str, Usage] = {}
+    missing = []
+    for build in builds:
+        if isinstance(build.meta, BuildMeta) and build.meta.size is not None:
+            usages[build.build_id] = (build.meta.size, {})
+        else:
+            missing.append(build)
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        for build, usage in zip(
+            missing, executor.map(shared_disk_usage, (b.path for b in missing))
+        ):
+            usages[build.build_id] = usage
+            unshared, shared = usage
+            # Builds still running will grow
+            if (
+                isinstance(build.meta, BuildMeta)
+                and build.meta.status != BuildStatus.pending
+                and not shared
+            ):
+                build.meta.size = unshared
+
+    return usages
+
+
 def purge_deployments(
     *,
     deploy_root: Path,
@@ -79,12 +258,24 @@ def purge_deployments(
     dry_run: bool,
     what_to_purge: PurgeSpecification,
     reporter: Reporter,
-):
+    jobs: int = 1,
+    background: bool = False,
+) -> List[Build]:
+    """
+    Remove the builds selected by `what_to_purge`, deleting up to `jobs`
+    builds at a time, or leaving the deletion to a background process if
+    `background` is set. Returns the builds that could not be removed.
+    """
     builds = list_builds(deploy_root)
     eligible_for_removal = [build for build in builds if not builds.is_selected(build)]
 
     reporter.info(what_to_purge.describe())
 
+    unsized = [
+        build
+        for build in eligible_for_removal
+        if isinstance(build.meta, BuildMeta) and build.meta.size is None
+    ]
     to_remove = what_to_purge.filter(eligible_for_removal)
 
     if dry_run:
@@ -102,8 +293,125 @@ def purge_deployments(
         else:
             description = f"Remove {build.build_id} (invalid metadata)"
         reporter.info(description)
+        reporter.output("selected_for_removal", None, **build.to_dict())
+
+    if dry_run:
+        return []
+
+    # Sizes computed while selecting the builds, to be reused next time
+    for build in unsized:
+        if (
+            isinstance(build.meta, BuildMeta)
+            and build.meta.size is not None
+            and build not in to_remove
+        ):
+            save_build_meta(build)
+
+    # Moving the builds out of the way is quick, and leaves no half-removed
+    # build behind if the actual removal is interrupted.
+    with build_index(deploy_root).updating() as index_entries:
+        # Other laika processes may have changed the deploy root since the
+        # builds were listed
+        linked = set(current_links(deploy_root).values())
+        trashed = []
+        for build in to_remove:
+            if build.build_id in linked:
+                reporter.info(f"Not removing {build.build_id}: it was just deployed")
+                continue
+            if not build.path.is_dir():
+                continue
+
+            lock_path = build_lock_path(deploy_root, build.build_id)
+            lock_fd = try_exclusive_lock(lock_path)
+            if lock_fd is None:
+                reporter.info(f"Not removing {build.build_id}: it is in use")
+                continue
+            try:
+                trashed.append((build, move_to_trash(build.path, deploy_root)))
+                index_entries.pop(build.build_id, None)
+                lock_path.unlink()
+            finally:
+                os.close(lock_fd)
+
+        evicted = [
+            move_to_trash(entry, deploy_root)
+            for entry in unused_entries(deploy_root, _oldest_build_time(index_entries))
+        ]
+
+    if evicted:
+        reporter.info("Removing %d unused build cache entries" % len(evicted))
+    if trashed:
+        _prune_worktrees(deploy_root, git_dir, reporter)
+
+    if background:
+        if trashed or evicted:
+            spawn_reaper(deploy_root)
+        if trashed:
+            reporter.success(
+                "Moved %d builds to the trash; removing them in the background"
+                % len(trashed)
+            )
+        for build, _ in trashed:
+            reporter.output("trashed", None, build_id=build.build_id)
+        return []
+
+    for path in evicted:
+        remove_tree(path)
+    return remove_trashed_builds(trashed, jobs=jobs, reporter=reporter)
+
+
+def _oldest_build_time(index_entries) -> float:
+    """
+    The creation time, as a Unix timestamp, of the oldest of the indexed
+    builds. Cache entries not used since then are not used by any of them.
+    """
+    timestamps = [
+        BuildMeta.from_dict(entry).timestamp
+        for entry in index_entries.values()
+        if entry is not None
+    ]
+    if not timestamps:
+        return time.time()
+    return min(timestamps).replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def remove_build(build: Build, deploy_root: Path, git_dir: Path, reporter: Reporter):
+    """Remove a single build, such as one that failed, right away."""
+    with build_index(deploy_root).updating() as index_entries:
+        path = move_to_trash(build.path, deploy_root)
+        index_entries.pop(build.build_id, None)
+        with contextlib.suppress(FileNotFoundError):
+            build_lock_path(deploy_root, build.build_id).unlink()
+
+    _prune_worktrees(deploy_root, git_dir, reporter)
+    remove_tree(path)
+    reporter.info(f"Removed {build.build_id}")
+
+
+def _prune_worktrees(deploy_root: Path, git_dir: Path, reporter: Reporter):
+    # Worktrees of new builds are added while the deploy root is locked
+    with deploy_root_lock(deploy_root):
+        run_git(
+            ["worktree", "prune"], gitdir=git_dir, stdout=reporter.subprocess_stdout
+        ).check_returncode()
+
+
+def remove_trashed_builds(trashed, jobs: int, reporter: Reporter) -> List[Build]:
+    failed = []
+
+    def remove(build: Build, path: Path):
+        try:
+            remove_tree(path)
+        except OSError as e:
+            reporter.error(f"Failed to remove {build.build_id}: {e}")
+            reporter.output("remove_failed", None, build_id=build.build_id)
+            failed.append(build)
+        else:
+            reporter.success(f"Removed {build.build_id}")
+            reporter.output("removed", None, build_id=build.build_id)
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        for build, path in trashed:
+            executor.submit(remove, build, path)
 
-        if not dry_run:
-            subprocess.run(
-                ["git", "worktree", "remove", "--force", str(build.path)], cwd=git_dir
-            ).check_returncode()
+    return failed
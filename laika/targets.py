@@ -0,0 +1,94 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Sequence
+
+from laika.core import (
+    Build,
+    BuildMeta,
+    BuildMetaFile,
+    TargetConfig,
+    build_index,
+    deploy_prepared_build,
+)
+from laika.fs import copy_tree
+from laika.logs import LOG_FILE
+from laika.output import Reporter
+from laika.trash import remove_tree
+
+
+def replicate_build(build: Build, target: TargetConfig, reporter: Reporter) -> Build:
+    """
+    Copy a build into the deploy root of a target, unless it is already
+    there. The copy is not a Git worktree.
+    """
+    assert isinstance(build.meta, BuildMeta)
+
+    path = target.deploy_root / build.build_id
+    meta = BuildMeta.from_dict(build.meta.to_dict())
+    replica = Build(build.build_id, path, meta)
+    if path.exists():
+        return replica
+
+    reporter.info(
+        "Copying build %s to target %s (%s)"
+        % (build.build_id, target.name, target.replication_method)
+    )
+    # The copy is made under a hidden name, which is not seen as a build, so
+    # that the target is not locked for the whole copy and an interrupted
+    # copy is never taken for a complete replica
+    staging = Path(
+        tempfile.mkdtemp(prefix=".%s." % build.build_id, dir=str(target.deploy_root))
+    )
+    try:
+        # The metadata file is written separately, and the replica starts
+        # its own log, so that they are never shared with the original build
+        copy_tree(
+            build.path,
+            staging / build.build_id,
+            method=target.replication_method,
+            exclude=[".git", BuildMetaFile._PATH, LOG_FILE + "*"],
+        )
+        BuildMetaFile.write(staging / build.build_id, meta)
+
+        with build_index(target.deploy_root).updating() as index_entries:
+            # Unless it was replicated concurrently
+            if not path.exists():
+                os.rename(str(staging / build.build_id), str(path))
+                index_entries[replica.build_id] = meta.to_dict()
+    finally:
+        remove_tree(staging)
+
+    return replica
+
+
+def deploy_to_targets(
+    build: Build, targets: Sequence[TargetConfig], reporter: Reporter
+) -> List[str]:
+    """
+    Deploy a build to several targets concurrently. Returns the names of the
+    targets for which deployment failed.
+    """
+    failed = []
+
+    def deploy(target: TargetConfig):
+        try:
+            if target.deploy_root.samefile(build.path.parent):
+                replica = build
+            else:
+                replica = replicate_build(build, target, reporter)
+            deploy_prepared_build(replica, target, reporter)
+        except Exception as e:
+            reporter.error("Failed to deploy to target %s: %s" % (target.name, e))
+            failed.append(target.name)
+        else:
+            reporter.output(
+                "deployed_to_target", None, target=target.name, build_id=build.build_id
+            )
+
+    with ThreadPoolExecutor(max_workers=max(len(targets), 1)) as executor:
+        for target in targets:
+            executor.submit(deploy, target)
+
+    return failed
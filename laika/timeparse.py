@@ -0,0 +1,93 @@
+import calendar
+import datetime
+import re
+from typing import Optional
+
+_RELATIVE_PATTERN = re.compile(r"^\s*(\d+)\s*([hdw])\s*$", re.IGNORECASE)
+
+_RELATIVE_UNITS = {"h": "hours", "d": "days", "w": "weeks"}
+
+_ISO_DURATION_PATTERN = re.compile(
+    r"^P(?!$)(?:(\d+)Y)?(?:(\d+)M)?(?:(\d+)W)?(?:(\d+)D)?"
+    r"(?:T(?=\d)(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?)?$",
+    re.IGNORECASE,
+)
+
+_ISO_TIMESTAMP_PATTERN = re.compile(
+    r"^(\d{4})-(\d{2})-(\d{2})"
+    r"(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6}))?)?)?"
+    r"\s*(Z|[+-]\d{2}:?\d{2})?$",
+    re.IGNORECASE,
+)
+
+
+def _subtract_months(moment: datetime.datetime, months: int) -> datetime.datetime:
+    month_index = moment.year * 12 + moment.month - 1 - months
+    year, month = divmod(month_index, 12)
+    day = min(moment.day, calendar.monthrange(year, month + 1)[1])
+    return moment.replace(year=year, month=month + 1, day=day)
+
+
+def _parse_iso_duration(match, now: datetime.datetime) -> Optional[datetime.datetime]:
+    years, months, weeks, days, hours, minutes, seconds = match.groups()
+    moment = _subtract_months(now, int(years or 0) * 12 + int(months or 0))
+    return moment - datetime.timedelta(
+        weeks=int(weeks or 0),
+        days=int(days or 0),
+        hours=int(hours or 0),
+        minutes=int(minutes or 0),
+        seconds=float(seconds or 0),
+    )
+
+
+def _parse_iso_timestamp(match) -> datetime.datetime:
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    moment = datetime.datetime(
+        int(year),
+        int(month),
+        int(day),
+        int(hour or 0),
+        int(minute or 0),
+        int(second or 0),
+        int((fraction or "0").ljust(6, "0")),
+    )
+    if offset and offset.upper() != "Z":
+        sign = -1 if offset[0] == "-" else 1
+        digits = offset[1:].replace(":", "")
+        moment -= sign * datetime.timedelta(
+            hours=int(digits[:2]), minutes=int(digits[2:])
+        )
+    return moment
+
+
+def parse_relative_time(
+    string: str, now: Optional[datetime.datetime] = None
+) -> Optional[datetime.datetime]:
+    """
+    Parse a point in the past given as an amount of time ago (`10d`, `2w`,
+    `12h`, or an ISO 8601 duration such as `P1DT12H`) or as an ISO 8601
+    date/time, without a time zone meaning UTC. The result is a naive UTC
+    datetime. Returns None for any other format.
+    """
+    if now is None:
+        now = datetime.datetime.utcnow()
+
+    string = string.strip()
+
+    match = _RELATIVE_PATTERN.match(string)
+    if match:
+        amount, unit = match.groups()
+        return now - datetime.timedelta(**{_RELATIVE_UNITS[unit.lower()]: int(amount)})
+
+    match = _ISO_DURATION_PATTERN.match(string)
+    if match:
+        return _parse_iso_duration(match, now)
+
+    match = _ISO_TIMESTAMP_PATTERN.match(string)
+    if match:
+        try:
+            return _parse_iso_timestamp(match)
+        except ValueError:
+            return None
+
+    return None
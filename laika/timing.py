@@ -0,0 +1,82 @@
+import contextlib
+import math
+import time
+from typing import Dict, List, Optional, Sequence
+
+# Phases of a deployment, in the order they happen
+PHASES = (
+    "fetch",
+    "resolve",
+    "checkout",
+    "dependencies",
+    "build",
+    "activate",
+    "post_deploy",
+)
+
+
+class PhaseTimer:
+    """Records the time (in seconds) taken by each phase into a dict."""
+
+    def __init__(self, timings: Optional[Dict[str, float]] = None):
+        self.timings = timings if timings is not None else {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty sequence of values."""
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class PhaseStats:
+    def __init__(self, phase: str, durations: List[float], window: int):
+        """
+        Statistics for the durations of a phase, which must be given from
+        the oldest to the most recent build. The trend compares the median
+        of the latest `window` builds to the median of the `window` builds
+        before them.
+        """
+        self.phase = phase
+        self.count = len(durations)
+        self.p50 = percentile(durations, 0.5)
+        self.p95 = percentile(durations, 0.95)
+        self.last = durations[-1]
+
+        recent = durations[-window:]
+        previous = durations[-2 * window : -window]
+        self.trend: Optional[float] = None
+        if recent and previous:
+            baseline = percentile(previous, 0.5)
+            if baseline > 0:
+                self.trend = percentile(recent, 0.5) / baseline - 1
+
+
+def summarize_timings(
+    timings: Sequence[Dict[str, float]], window: int = 10
+) -> List[PhaseStats]:
+    """
+    Compute statistics for each phase from the timings of several builds,
+    ordered from the oldest to the most recent one.
+    """
+    known_phases = list(PHASES)
+    extra_phases = sorted({p for t in timings for p in t if p not in PHASES})
+
+    stats = []
+    for phase in known_phases + extra_phases + ["total"]:
+        if phase == "total":
+            durations = [sum(t.values()) for t in timings if t]
+        else:
+            durations = [t[phase] for t in timings if phase in t]
+        if durations:
+            stats.append(PhaseStats(phase, durations, window))
+    return stats
@@ -0,0 +1,149 @@
+import contextlib
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from .fs import disk_usage
+from .index import STATE_DIR
+from .process import spawn_detached
+
+# Directory under the deploy root where builds are moved before being deleted
+TRASH_DIR = ".trash"
+
+
+_REAPER_PID_FILE = "reaper.pid"
+_REAPER_LOG_FILE = "reaper.log"
+
+
+def trash_dir(deploy_root: Path) -> Path:
+    return deploy_root / TRASH_DIR
+
+
+def move_to_trash(path: Path, deploy_root: Path) -> Path:
+    """
+    Atomically move a directory in the deploy root to the trash, where it
+    can be deleted at leisure without being seen as a build.
+    """
+    trash = trash_dir(deploy_root)
+    trash.mkdir(exist_ok=True)
+
+    target = trash / path.name
+    suffix = 0
+    while target.exists():
+        suffix += 1
+        target = trash / ("%s.%d" % (path.name, suffix))
+
+    os.rename(path, target)
+    return target
+
+
+def _handle_remove_error(function, path, exc_info):
+    error = exc_info[1]
+    if isinstance(error, FileNotFoundError):
+        return
+    if isinstance(error, PermissionError):
+        # Read-only directories (e.g. some package caches) keep their entries
+        # from being removed
+        parent = os.path.dirname(path)
+        os.chmod(parent, 0o700)
+        function(path)
+        return
+    raise error
+
+
+def remove_tree(path: Path):
+    shutil.rmtree(str(path), onerror=_handle_remove_error)
+
+
+def empty_trash(deploy_root: Path):
+    trash = trash_dir(deploy_root)
+
+    # Builds may be trashed while we are at it
+    while True:
+        try:
+            entries = sorted(trash.iterdir())
+        except FileNotFoundError:
+            return
+        if not entries:
+            return
+
+        for path in entries:
+            remove_tree(path)
+
+
+def _pid_file(deploy_root: Path) -> Path:
+    return deploy_root / STATE_DIR / _REAPER_PID_FILE
+
+
+def reaper_pid(deploy_root: Path) -> Optional[int]:
+    """Return the PID of the running background reaper, if there is one."""
+    try:
+        pid = int(_pid_file(deploy_root).read_text())
+    except (OSError, ValueError):
+        return None
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return pid
+
+
+def spawn_reaper(deploy_root: Path):
+    """
+    Empty the trash in a detached, low priority background process, which
+    survives the end of the current command.
+    """
+    state_dir = deploy_root / STATE_DIR
+    state_dir.mkdir(exist_ok=True)
+
+    proc = spawn_detached(
+        [sys.executable, "-m", "laika.trash", str(deploy_root)],
+        log_path=str(state_dir / _REAPER_LOG_FILE),
+    )
+    # Also written by the reaper itself, but this way it is known to be
+    # running as soon as it is started
+    _pid_file(deploy_root).write_text(str(proc.pid))
+    return proc
+
+
+class TrashStatus(NamedTuple):
+    entries: int
+    size: int
+    reaper_pid: Optional[int]
+
+
+def trash_status(deploy_root: Path) -> TrashStatus:
+    trash = trash_dir(deploy_root)
+    try:
+        entries = list(trash.iterdir())
+    except FileNotFoundError:
+        entries = []
+
+    return TrashStatus(
+        entries=len(entries),
+        size=sum(disk_usage(path) for path in entries),
+        reaper_pid=reaper_pid(deploy_root),
+    )
+
+
+def main():
+    deploy_root = Path(sys.argv[1])
+    pid = str(os.getpid())
+    pid_file = _pid_file(deploy_root)
+    pid_file.write_text(pid)
+    try:
+        empty_trash(deploy_root)
+    finally:
+        # Another reaper may have been started (or finished) in the meantime
+        with contextlib.suppress(FileNotFoundError):
+            if pid_file.read_text() == pid:
+                pid_file.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import re
+
+_SIZE_UNITS = ["B", "KiB", "MiB", "GiB", "TiB", "PiB"]
+
+_SIZE_PATTERN = re.compile(
+    r"^\s*(\d+(?:\.\d+)?)\s*([kmgtp]?)(?:i?b)?\s*$", re.IGNORECASE
+)
+
+
+def format_size(num_bytes: int) -> str:
+    size = float(num_bytes)
+    for unit in _SIZE_UNITS[:-1]:
+        if abs(size) < 1024:
+            break
+        size /= 1024
+    else:
+        unit = _SIZE_UNITS[-1]
+
+    if unit == "B":
+        return "%d %s" % (size, unit)
+    return "%.1f %s" % (size, unit)
+
+
+def parse_size(string: str) -> int:
+    """
+    Parse a size such as `512M` or `20G` into a number of bytes. Unit
+    prefixes are binary (1K = 1024 bytes).
+    """
+    match = _SIZE_PATTERN.match(string)
+    if not match:
+        raise ValueError("invalid size: %r" % string)
+
+    number, prefix = match.groups()
+    exponent = " kmgtp".index(prefix.lower()) if prefix else 0
+    return int(float(number) * 1024 ** exponent)
+
+
+def non_negative_int(string: str) -> int:
+    """Command-line argument type for counts that may be zero."""
+    value = int(string)
+    if value < 0:
+        raise argparse.ArgumentTypeError("%r is negative" % string)
+
+    return value
+
+
+def positive_int(string: str) -> int:
+    """Command-line argument type for counts that must be at least 1."""
+    value = int(string)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("%r is not positive" % string)
+
+    return value
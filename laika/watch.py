@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Set
+
+from laika.backend.git.tree import fetch_from_remote, fetch_ref
+from laika.build import prepare_build
+from laika.core import Config, find_reusable_build, list_builds
+from laika.git import BatchCommitResolver
+from laika.output import Reporter
+
+
+class Watcher:
+    """
+    Polls Git refs for new commits and builds them in the background, so
+    that they are ready to be deployed by the time they are needed.
+    """
+
+    def __init__(self, refs: List[str], config: Config, reporter: Reporter, jobs: int):
+        self.refs = refs
+        self.config = config
+        self.reporter = reporter
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        self.in_progress: Set[str] = set()
+        self.failed: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        settings = self.config.fetch_settings
+        if settings.strategy == "ref":
+            for ref in self.refs:
+                fetch_ref(ref, self.config.git_dir, self.reporter, settings)
+        else:
+            fetch_from_remote(self.config.git_dir, self.reporter, settings)
+
+    def poll(self, fetch_first: bool):
+        if fetch_first:
+            try:
+                self.fetch()
+            except Exception as e:
+                self.reporter.error("Failed to fetch: %s" % e)
+
+        builds = list_builds(self.config.deploy_root, allow_invalid=False)
+        build_key = self.config.build_key
+
+        with BatchCommitResolver(gitdir=self.config.git_dir) as resolver:
+            for ref in self.refs:
+                git_hash = resolver.resolve(ref)
+                if git_hash is None:
+                    self.reporter.error("Invalid git reference: %s" % ref)
+                    continue
+
+                with self._lock:
+                    if git_hash in self.in_progress or git_hash in self.failed:
+                        continue
+                if find_reusable_build(builds, git_hash, build_key) is not None:
+                    continue
+
+                self.reporter.info("New commit %s on %s; building" % (git_hash, ref))
+                with self._lock:
+                    self.in_progress.add(git_hash)
+                self.executor.submit(self._build, ref, git_hash)
+
+    def _build(self, ref: str, git_hash: str):
+        try:
+            build = prepare_build(
+                git_ref=ref,
+                fetch_first=False,
+                reuse=True,
+                config=self.config,
+                reporter=self.reporter,
+                git_hash=git_hash,
+            )
+        except Exception as e:
+            self.reporter.error("Build of %s (%s) failed: %s" % (ref, git_hash, e))
+            with self._lock:
+                self.failed.add(git_hash)
+        else:
+            self.reporter.success("Build %s is ready" % build.build_id)
+            self.reporter.output("build", None, **build.to_dict())
+        finally:
+            with self._lock:
+                self.in_progress.discard(git_hash)
+
+    def wait_for_builds(self):
+        self.executor.shutdown(wait=True)
+
+    def run(
+        self,
+        interval: float,
+        fetch_first: bool,
+        trigger_file: Optional[Path] = None,
+        once: bool = False,
+    ):
+        try:
+            while True:
+                self.poll(fetch_first)
+                if once:
+                    break
+                _sleep_until_triggered(interval, trigger_file)
+        finally:
+            self.wait_for_builds()
+
+
+def _mtime(path: Optional[Path]) -> Optional[float]:
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _sleep_until_triggered(interval: float, trigger_file: Optional[Path]):
+    """
+    Sleep for `interval` seconds, or less if the trigger file is touched in
+    the meantime.
+    """
+    deadline = time.monotonic() + interval
+    initial_mtime = _mtime(trigger_file)
+    while time.monotonic() < deadline:
+        time.sleep(min(1.0, max(deadline - time.monotonic(), 0)))
+        if _mtime(trigger_file) != initial_mtime:
+            return
@@ -9,6 +9,7 @@ from testing_helpers.git import GitRepo
 
 SOURCE_DIR = "source"
 TARGET_DIR = "target"
+REMOTE_DIR = "remote.git"
 
 
 @fixture(name="fixture.root_dir")
@@ -86,3 +87,55 @@ def set_shell(context, shell: str):
         config["general"]["shell"] = shell
 
     update_config_file(context, update)
+
+
+def set_config_option(context, section: str, option: str, value: str):
+    def update(config: configparser.ConfigParser):
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, option, value)
+
+    update_config_file(context, update)
+
+
+def remove_config_option(context, section: str, option: str):
+    def update(config: configparser.ConfigParser):
+        config.remove_option(section, option)
+
+    update_config_file(context, update)
+
+
+def commit_file(context, path: str, content: str = ""):
+    source_dir = context.root_dir.path / SOURCE_DIR
+    file_path = source_dir / path
+
+    os.makedirs(file_path.parent, exist_ok=True)
+    with open(file_path, "w") as stream:
+        stream.write(content)
+
+    repo = GitRepo(source_dir)
+    repo.run(["git", "add", path])
+    repo.run(["git", "commit", "-m", "Add " + path])
+
+
+def push_file_to_remote(context, path: str):
+    """
+    Set up a remote `origin` for the source repository, and push to it a
+    new commit that the source repository does not have yet.
+    """
+    root_dir = context.root_dir.path
+    source_dir = root_dir / SOURCE_DIR
+    remote_dir = root_dir / REMOTE_DIR
+    other_dir = root_dir / "other"
+
+    if not remote_dir.exists():
+        context.root_dir.run(["git", "clone", "-q", "--bare", SOURCE_DIR, REMOTE_DIR])
+        GitRepo(source_dir).run(["git", "remote", "add", "origin", str(remote_dir)])
+        context.root_dir.run(["git", "clone", "-q", REMOTE_DIR, "other"])
+
+    other = GitRepo(other_dir)
+    with open(other_dir / path, "w") as stream:
+        stream.write("")
+    other.run(["git", "add", path])
+    other.run(["git", "commit", "-m", "Add " + path])
+    other.run(["git", "push", "origin", "HEAD"])
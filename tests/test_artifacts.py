@@ -0,0 +1,93 @@
+import datetime
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from laika.artifacts import cache_dir, restore_outputs, save_outputs, unused_entries
+from laika.core import (
+    Build,
+    BuildMeta,
+    BuildStatus,
+    Config,
+    ConfigError,
+    run_build_steps,
+)
+from laika.output import Reporter
+
+
+def test_build_step_inputs_require_outputs(tmp_path):
+    config_file = tmp_path / "deploy.ini"
+    config_file.write_text("[build:migrate]\nrun = ./migrate\ninputs = migrations/*\n")
+
+    with pytest.raises(ConfigError, match="outputs"):
+        Config.read(str(config_file)).build_steps
+
+
+def test_cache_entries_not_used_since_are_unused(tmp_path):
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    (build_dir / "out").write_text("output")
+    for key in ("old", "restored", "saved"):
+        assert save_outputs(key, ["out"], tmp_path, build_dir)
+    an_hour_ago = time.time() - 3600
+    for entry in cache_dir(tmp_path).iterdir():
+        os.utime(str(entry), (an_hour_ago, an_hour_ago))
+
+    since = time.time() - 60
+    assert restore_outputs("restored", ["out"], tmp_path, build_dir)
+    assert save_outputs("saved", ["out"], tmp_path, build_dir)
+
+    assert [entry.name for entry in unused_entries(tmp_path, since)] == ["old"]
+
+
+def test_restore_failure_is_a_miss(tmp_path):
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    (build_dir / "a").write_text("a")
+    (build_dir / "b").write_text("b")
+    assert save_outputs("key", ["a", "b"], tmp_path, build_dir)
+    # As if the entry was evicted while being restored
+    (cache_dir(tmp_path) / "key" / "b").unlink()
+
+    assert not restore_outputs("key", ["a", "b"], tmp_path, build_dir)
+    assert not (build_dir / "a").exists()
+    assert not (build_dir / "b").exists()
+
+
+def _build(deploy_root: Path, build_id: str, input_text: str) -> Build:
+    path = deploy_root / build_id
+    path.mkdir()
+    (path / "input.txt").write_text(input_text)
+    meta = BuildMeta(
+        source_path="/src",
+        git_ref="main",
+        git_hash="0" * 40,
+        timestamp=datetime.datetime(2020, 1, 1),
+        status=BuildStatus.pending,
+    )
+    return Build(build_id, path, meta)
+
+
+def test_build_step_is_skipped_while_its_inputs_are_unchanged(tmp_path):
+    deploy_root = tmp_path / "deploy"
+    deploy_root.mkdir()
+    runs = tmp_path / "runs"
+    config_file = tmp_path / "deploy.ini"
+    config_file.write_text(
+        "[dirs]\ngit = %s\ndeploy = %s\n" % (tmp_path, deploy_root)
+        + "[build:generate]\n"
+        + "run = echo run >> %s && cp input.txt output.txt\n" % runs
+        + "inputs = input.txt\noutputs = output.txt\n"
+    )
+    config = Config.read(str(config_file))
+    reporter = Reporter(quiet=True)
+
+    for build_id, input_text in [("1", "one"), ("2", "one"), ("3", "two")]:
+        build = _build(deploy_root, build_id, input_text)
+        run_build_steps(build, config, reporter)
+        assert (build.path / "output.txt").read_text() == input_text
+
+    # Not run again for the second build, which has the same input
+    assert runs.read_text().splitlines() == ["run", "run"]
@@ -0,0 +1,65 @@
+import datetime
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from laika.core import BuildMeta, BuildMetaFile, BuildStatus, list_builds
+
+# Set to e.g. 10000 to also time listing a very large deploy root
+LARGE_DEPLOY_ROOT = int(os.environ.get("LAIKA_BENCHMARK_BUILDS", "0"))
+
+# Timings are unreliable on busy machines, so budgets are only checked on
+# request (or when timing a large deploy root)
+CHECK_BUDGETS = bool(os.environ.get("LAIKA_BENCHMARK")) or bool(LARGE_DEPLOY_ROOT)
+
+# Generous time budgets, in seconds per 1000 builds, to catch regressions
+# that make listing builds grow much slower than linearly
+SCAN_BUDGET = 2.0
+INDEX_BUDGET = 0.5
+
+
+def _create_builds(deploy_root: Path, count: int):
+    start = datetime.datetime(2020, 1, 1)
+    for i in range(count):
+        timestamp = start + datetime.timedelta(minutes=i)
+        build_id = timestamp.strftime("%Y%m%d%H%M%S") + "_0000000_main"
+        build_dir = deploy_root / build_id
+        build_dir.mkdir()
+        meta = BuildMeta(
+            source_path="/src",
+            git_ref="main",
+            git_hash="0" * 40,
+            timestamp=timestamp,
+            status=BuildStatus.succeeded,
+            size=1024,
+        )
+        BuildMetaFile.write(build_dir, meta)
+
+
+def _time_list_builds(deploy_root: Path, count: int) -> float:
+    start = time.perf_counter()
+    builds = list_builds(deploy_root)
+    elapsed = time.perf_counter() - start
+
+    assert len(builds.builds) == count
+    return elapsed
+
+
+COUNTS = [10, 1000] + ([LARGE_DEPLOY_ROOT] if LARGE_DEPLOY_ROOT else [])
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def test_list_builds_time(tmp_path, count):
+    _create_builds(tmp_path, count)
+    scale = max(count, 1000) / 1000
+
+    # Without an index, every build directory is scanned
+    scan_time = _time_list_builds(tmp_path, count)
+    # Then the index written by the scan is used
+    index_time = _time_list_builds(tmp_path, count)
+
+    if CHECK_BUDGETS:
+        assert scan_time < SCAN_BUDGET * scale
+        assert index_time < INDEX_BUDGET * scale
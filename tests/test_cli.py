@@ -0,0 +1,103 @@
+import os
+import pkgutil
+import subprocess
+import sys
+
+import pytest
+
+import laika.commands
+from laika.commands import COMMANDS, load_command_module
+from laika.core import Config, ConfigError
+
+# Modules that take long to import and are only needed by some commands
+HEAVY_MODULES = ("dateparser", "inquirer", "pytz", "importlib.metadata")
+
+# Time budget for importing everything `laika list` needs; only checked
+# when LAIKA_BENCHMARK is set, as timings are unreliable on busy machines
+IMPORT_TIME_BUDGET = 0.1
+
+
+def test_every_command_is_registered():
+    modules = {
+        module_info.name
+        for module_info in pkgutil.iter_modules(laika.commands.__path__)
+    }
+
+    assert set(COMMANDS) == modules
+    for name in COMMANDS:
+        assert callable(load_command_module(name).register)
+
+
+def _import_times(args):
+    """
+    Cumulative import time, in seconds, of each module imported by laika,
+    and whether it was imported at the top level.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "laika.cli"] + args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+    )
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        top_level = not name.startswith("   ")
+        times[name.strip()] = (int(cumulative) / 1e6, top_level)
+    return times
+
+
+def test_list_does_not_import_heavy_modules(tmp_path):
+    times = _import_times(["-C", str(tmp_path / "deploy.ini"), "list"])
+
+    for module in HEAVY_MODULES:
+        assert module not in times
+
+
+@pytest.mark.skipif(
+    not os.environ.get("LAIKA_BENCHMARK"), reason="LAIKA_BENCHMARK is not set"
+)
+def test_list_starts_quickly(tmp_path):
+    times = _import_times(["-C", str(tmp_path / "deploy.ini"), "list"])
+
+    # Modules imported with `importlib` (such as the command module itself)
+    # are not reported, but the modules they import are
+    laika_time = sum(
+        t
+        for name, (t, top_level) in times.items()
+        if name.startswith("laika") and top_level
+    )
+    assert laika_time < IMPORT_TIME_BUDGET
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["watch", "--jobs", "0"],
+        ["purge", "--jobs", "0"],
+        ["stats", "--last", "0"],
+        ["stats", "--window", "0"],
+        ["dedupe", "--jobs", "0"],
+    ],
+)
+def test_counts_must_be_positive(tmp_path, args):
+    proc = subprocess.run(
+        [sys.executable, "-m", "laika.cli", "-C", str(tmp_path / "deploy.ini")] + args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+    )
+
+    assert proc.returncode == 2
+    assert "'0' is not positive" in proc.stderr
+
+
+def test_watch_jobs_setting_must_be_positive(tmp_path):
+    config_file = tmp_path / "deploy.ini"
+    config_file.write_text("[watch]\njobs = 0\n")
+
+    with pytest.raises(ConfigError, match="watch.jobs"):
+        Config.read(str(config_file)).watch_jobs
@@ -0,0 +1,66 @@
+import subprocess
+
+import pytest
+
+from laika.backend.git.tree import _export_archive
+from laika.core import ref_link_name
+from laika.git import BatchCommitResolver, GitRevisionParseFail, resolve_commit
+from testing_helpers.dirs import DirectoryContext
+from testing_helpers.git import GitRepo
+
+
+@pytest.fixture
+def git_repo():
+    with DirectoryContext() as tempdir:
+        repo = GitRepo(tempdir.path)
+        repo.create()
+        with open(repo.dirname / "hello.txt", "w") as stream:
+            stream.write("hello world")
+        repo.run(["git", "add", "."])
+        repo.run(["git", "commit", "-m", "C1"])
+        yield repo
+
+
+# noinspection PyShadowingNames
+def test_resolve_commit(git_repo: GitRepo):
+    full_hash, short_hash = resolve_commit("main", gitdir=git_repo.dirname)
+
+    expected = git_repo.run(["git", "rev-parse", "HEAD"], encoding="ascii")
+    assert full_hash == expected.stdout.strip()
+    assert full_hash.startswith(short_hash)
+    assert len(short_hash) < len(full_hash)
+
+
+# noinspection PyShadowingNames
+def test_resolve_commit_of_invalid_ref(git_repo: GitRepo):
+    with pytest.raises(GitRevisionParseFail):
+        resolve_commit("nonexistent", gitdir=git_repo.dirname)
+
+
+# noinspection PyShadowingNames
+def test_batch_commit_resolver(git_repo: GitRepo):
+    expected = git_repo.run(["git", "rev-parse", "HEAD"], encoding="ascii")
+
+    with BatchCommitResolver(gitdir=git_repo.dirname) as resolver:
+        assert resolver.resolve("main") == expected.stdout.strip()
+        assert resolver.resolve("nonexistent") is None
+        assert resolver.resolve("HEAD") == expected.stdout.strip()
+
+
+# noinspection PyShadowingNames
+def test_export_archive_reports_git_failure(git_repo: GitRepo, tmp_path):
+    with pytest.raises(subprocess.CalledProcessError):
+        _export_archive(tmp_path, "HEAD", git_repo.dirname, ["nonexistent"])
+
+
+@pytest.mark.parametrize(
+    "ref",
+    [
+        "feature/login",
+        "origin/feature/login",
+        "refs/heads/feature/login",
+        "refs/remotes/origin/feature/login",
+    ],
+)
+def test_ref_link_name_is_shared_by_a_branch_and_its_remote_branch(ref):
+    assert ref_link_name(ref) == "current-feature--login"
@@ -0,0 +1,101 @@
+import datetime
+import os
+import subprocess
+import sys
+
+import pytest
+
+from laika.core import BuildMeta, BuildMetaFile, BuildStatus, list_builds, using_build
+from laika.dedupe import dedupe_builds
+from laika.index import build_lock_path
+from laika.lock import LockTimeout, exclusive_lock, try_exclusive_lock
+from laika.output import Reporter
+from laika.purge import PurgeSpecification, purge_deployments
+
+
+def test_lock_timeout_tells_who_holds_the_lock(tmp_path):
+    path = tmp_path / "lock"
+
+    with exclusive_lock(path):
+        with pytest.raises(LockTimeout, match="held by PID %d" % os.getpid()):
+            with exclusive_lock(path, timeout=0.1):
+                pass
+
+
+def test_lock_is_released_when_its_holder_dies(tmp_path):
+    path = tmp_path / "lock"
+    holder = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys, time; from laika.lock import exclusive_lock\n"
+            "with exclusive_lock(sys.argv[1]):\n"
+            "    print(flush=True); time.sleep(60)",
+            str(path),
+        ],
+        stdout=subprocess.PIPE,
+    )
+    holder.stdout.readline()
+    holder.kill()
+    holder.wait()
+
+    with exclusive_lock(path, timeout=1):
+        pass
+
+
+def test_builds_in_use_are_not_purged(tmp_path):
+    git_dir = tmp_path / "git"
+    deploy_root = tmp_path / "deploy"
+    deploy_root.mkdir()
+    subprocess.run(["git", "init", "-q", str(git_dir)], check=True)
+
+    for build_id in ("20200101000000_0000000_main", "20200102000000_0000000_main"):
+        build_dir = deploy_root / build_id
+        build_dir.mkdir()
+        meta = BuildMeta(
+            source_path=str(git_dir),
+            git_ref="main",
+            git_hash="0" * 40,
+            timestamp=datetime.datetime.strptime(build_id[:8], "%Y%m%d"),
+            status=BuildStatus.succeeded,
+        )
+        BuildMetaFile.write(build_dir, meta)
+
+    in_use, unused = list_builds(deploy_root)
+    with using_build(in_use):
+        purge_deployments(
+            deploy_root=deploy_root,
+            git_dir=git_dir,
+            dry_run=False,
+            what_to_purge=PurgeSpecification.keep_latest(0),
+            reporter=Reporter(color=False, quiet=True),
+        )
+
+    assert [b.build_id for b in list_builds(deploy_root)] == [in_use.build_id]
+
+
+def test_builds_being_purged_are_not_deduped(tmp_path):
+    for build_id in ("20200101000000_0000000_main", "20200102000000_0000000_main"):
+        build_dir = tmp_path / build_id
+        build_dir.mkdir()
+        (build_dir / "data").write_text("the same contents")
+        meta = BuildMeta(
+            source_path="/src",
+            git_ref="main",
+            git_hash="0" * 40,
+            timestamp=datetime.datetime.strptime(build_id[:8], "%Y%m%d"),
+            status=BuildStatus.succeeded,
+        )
+        BuildMetaFile.write(build_dir, meta)
+    builds = list_builds(tmp_path).builds
+    reporter = Reporter(color=False, quiet=True)
+
+    # As purge does while moving a build to the trash
+    lock_fd = try_exclusive_lock(build_lock_path(tmp_path, builds[0].build_id))
+    try:
+        result = dedupe_builds(builds, set(), reporter)
+    finally:
+        os.close(lock_fd)
+    assert result.files_linked == 0
+
+    assert dedupe_builds(builds, set(), reporter).files_linked == 1
@@ -0,0 +1,29 @@
+from laika.logs import LOG_FILE, BuildLog, read_log
+
+
+def _lines(build_dir):
+    data = b"".join(read_log(build_dir)).decode()
+    return [line.split(" ", 1)[1] for line in data.splitlines()]
+
+
+def test_build_log_rotation(tmp_path):
+    with BuildLog(tmp_path, max_size=100, backups=2) as log:
+        for i in range(10):
+            log.write_line(b"line %d\n" % i)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        LOG_FILE,
+        LOG_FILE + ".1",
+        LOG_FILE + ".2",
+    ]
+    lines = _lines(tmp_path)
+    assert lines == ["line %d" % i for i in range(10 - len(lines), 10)]
+
+
+def test_build_log_compression(tmp_path):
+    with BuildLog(tmp_path, max_size=100, backups=1, compress=True) as log:
+        for i in range(4):
+            log.write_line(b"line %d\n" % i)
+
+    assert (tmp_path / (LOG_FILE + ".1.gz")).exists()
+    assert _lines(tmp_path) == ["line 0", "line 1", "line 2", "line 3"]
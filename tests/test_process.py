@@ -0,0 +1,19 @@
+import os
+import subprocess
+
+from laika.process import ResourceLimits, limited_command
+
+
+def test_limited_command_sets_limits():
+    limits = ResourceLimits(cpu_limit=60, memory_limit=2 * 1024 ** 3, nice=5)
+    command = limited_command(["sh", "-c", "ulimit -t; ulimit -v; nice"], limits)
+
+    output = subprocess.run(
+        command, stdout=subprocess.PIPE, encoding="utf-8", check=True
+    ).stdout
+
+    assert output.split() == ["60", str(2 * 1024 ** 2), str(os.nice(0) + 5)]
+
+
+def test_limited_command_without_limits():
+    assert limited_command(["true"], ResourceLimits()) == ["true"]
@@ -0,0 +1,78 @@
+import datetime
+import os
+from pathlib import Path
+from typing import Optional
+
+from laika.commands.purge import parse_deployments_specification
+from laika.core import Build, BuildMeta, BuildStatus
+from laika.fs import disk_usage
+from laika.purge import KeepUnderSize
+
+
+def _build(
+    day: int,
+    size: Optional[int],
+    ref: str = "main",
+    deploy_root: Path = Path("/deploy"),
+) -> Build:
+    meta = BuildMeta(
+        source_path="/src",
+        git_ref=ref,
+        git_hash="0" * 40,
+        timestamp=datetime.datetime(2020, 1, day),
+        status=BuildStatus.succeeded,
+        size=size,
+    )
+    build_id = "202001%02d000000_0000000_%s" % (day, ref)
+    return Build(build_id, deploy_root / build_id, meta)
+
+
+def test_keep_under_size_discards_oldest_builds():
+    builds = [_build(day, size=100) for day in range(1, 6)]
+
+    purged = KeepUnderSize(250).filter(builds)
+
+    assert [b.build_id for b in purged] == [b.build_id for b in builds[2::-1]]
+
+
+def test_keep_under_size_keeps_everything_that_fits():
+    builds = [_build(day, size=100) for day in range(1, 4)]
+
+    assert KeepUnderSize(300).filter(builds) == []
+
+
+def test_keep_under_size_counts_hard_linked_files_once(tmp_path):
+    builds = [_build(day, size=None, deploy_root=tmp_path) for day in range(1, 4)]
+    for build in builds:
+        build.path.mkdir()
+    (builds[0].path / "data").write_bytes(b"x" * 1024 * 1024)
+    for build in builds[1:]:
+        os.link(str(builds[0].path / "data"), str(build.path / "data"))
+    size = disk_usage(builds[0].path)
+
+    assert KeepUnderSize(size * 3 // 2).filter(builds) == []
+    # Their usage depends on each other, so it is not recorded
+    assert all(build.meta.size is None for build in builds)
+
+
+def test_combined_specifications():
+    builds = [
+        _build(1, size=100, ref="v1"),
+        _build(2, size=100, ref="v1"),
+        _build(3, size=100, ref="v2"),
+        _build(4, size=100),
+        _build(5, size=100),
+        _build(6, size=100),
+    ]
+    spec = parse_deployments_specification(
+        "(keep_latest 2 or latest_per_ref v*) and max_size 300"
+    )
+
+    purged = spec.filter(builds)
+
+    # Latest 2, then the latest of v2, up to 3 builds in total
+    assert [b.build_id for b in purged] == [
+        builds[3].build_id,
+        builds[1].build_id,
+        builds[0].build_id,
+    ]
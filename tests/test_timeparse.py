@@ -0,0 +1,64 @@
+import datetime
+
+import pytest
+
+from laika.timeparse import parse_relative_time
+
+NOW = datetime.datetime(2020, 3, 31, 12, 0, 0)
+
+
+@pytest.mark.parametrize(
+    "string, expected",
+    [
+        ("10d", datetime.datetime(2020, 3, 21, 12)),
+        ("2w", datetime.datetime(2020, 3, 17, 12)),
+        ("3h", datetime.datetime(2020, 3, 31, 9)),
+        ("P1DT12H", datetime.datetime(2020, 3, 30, 0)),
+        ("P1M", datetime.datetime(2020, 2, 29, 12)),
+        ("PT90M", datetime.datetime(2020, 3, 31, 10, 30)),
+        ("2020-01-02", datetime.datetime(2020, 1, 2)),
+        ("2020-01-02T03:04:05Z", datetime.datetime(2020, 1, 2, 3, 4, 5)),
+        ("2020-01-02 03:04:05+02:00", datetime.datetime(2020, 1, 2, 1, 4, 5)),
+    ],
+)
+def test_parse_relative_time(string, expected):
+    assert parse_relative_time(string, now=NOW) == expected
+
+
+@pytest.mark.parametrize("string", ["yesterday", "2 weeks ago", "P", "2020-13-01"])
+def test_other_formats_are_not_parsed(string):
+    assert parse_relative_time(string, now=NOW) is None
+
+
+def _dateparser():
+    """The dateparser module, skipping the test if it cannot run here."""
+    dateparser = pytest.importorskip("dateparser")
+    try:
+        # Its patterns are compiled on first use, and can fail with some
+        # versions of the regex module
+        dateparser.parse("2020-01-02")
+    except Exception as e:
+        pytest.skip("dateparser cannot run here: %s" % e)
+    return dateparser
+
+
+@pytest.mark.parametrize(
+    "string",
+    [
+        "10d",
+        "2w",
+        "3h",
+        "2020-01-02",
+        "2020-01-02T03:04:05Z",
+        "2020-01-02 03:04:05+02:00",
+    ],
+)
+def test_same_result_as_dateparser(string):
+    expected = _dateparser().parse(
+        string,
+        settings={"PREFER_DATES_FROM": "past", "TIMEZONE": "UTC", "RELATIVE_BASE": NOW},
+    )
+    if expected.tzinfo is not None:
+        expected = expected.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    assert parse_relative_time(string, now=NOW) == expected
@@ -0,0 +1,22 @@
+from laika.timing import percentile, summarize_timings
+
+
+def test_percentile():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert percentile(values, 0.5) == 3.0
+    assert percentile(values, 0.95) == 5.0
+    assert percentile([7.0], 0.5) == 7.0
+
+
+def test_summarize_timings():
+    timings = [{"fetch": 1.0, "build": 10.0}] * 3 + [{"fetch": 1.0, "build": 15.0}] * 3
+
+    stats = {s.phase: s for s in summarize_timings(timings, window=3)}
+
+    assert list(stats) == ["fetch", "build", "total"]
+    assert stats["build"].count == 6
+    assert stats["build"].p50 == 10.0
+    assert stats["build"].p95 == 15.0
+    assert stats["build"].trend == 0.5
+    assert stats["fetch"].trend == 0.0
+    assert stats["total"].last == 16.0